@@ -1,28 +1,61 @@
 "use client"
 
-import { useState, useMemo } from "react"
+import { useState, useMemo, useEffect } from "react"
 import AdminLayout from "@/components/layout/admin-layout"
 import OrdersTable from "@/components/orders/orders-table"
 import OrdersHeader from "@/components/orders/orders-header"
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card"
 import { PieChartComponent, BarChartComponent } from "@/components/ui/chart"
-import { useOrdersForAdmin } from "@/hooks/queries/useorder"
+import { useAdminOrderStats, useOrdersForAdmin } from "@/hooks/queries/useorder"
 import { useToast } from "@/hooks/use-toast"
 import { TableLoading, ChartLoading } from "@/components/ui/loading"
 import { DataError } from "@/components/ui/error"
+import { Button } from "@/components/ui/button"
+import { AdminOrderFilters } from "@/lib/api/order"
 
 export default function OrdersPage() {
   const [searchTerm, setSearchTerm] = useState("")
   const [statusFilter, setStatusFilter] = useState("all")
   const [dateRange, setDateRange] = useState<any>(undefined)
 
-  const { data: mockOrders, isError, isLoading, refetch } = useOrdersForAdmin()
+  // Status and dates are filtered by the server, one page at a time;
+  // cursors[i] is the `after` cursor of page i
+  const [cursors, setCursors] = useState<(string | undefined)[]>([undefined])
+  const [total, setTotal] = useState<number | undefined>(undefined)
+  const page = cursors.length - 1
+
+  const filters = useMemo<AdminOrderFilters>(() => {
+    const result: AdminOrderFilters = {}
+    if (statusFilter !== "all") result.status = statusFilter
+    if (dateRange?.from) result.created_from = new Date(dateRange.from).toISOString()
+    if (dateRange?.to) {
+      // The selected end day is included
+      const end = new Date(dateRange.to)
+      end.setDate(end.getDate() + 1)
+      result.created_to = end.toISOString()
+    }
+    return result
+  }, [statusFilter, dateRange])
+
+  useEffect(() => {
+    setCursors([undefined])
+    setTotal(undefined)
+  }, [filters])
+
+  const { data, isError, isLoading, refetch } = useOrdersForAdmin(filters, cursors[page])
+  // Charts cover every matching order, the table one page of them
+  const { data: stats, isLoading: statsLoading, refetch: refetchStats } = useAdminOrderStats(filters)
+  const mockOrders = data?.orders
   const { toast } = useToast()
-  
+
+  useEffect(() => {
+    if (data?.total !== undefined) setTotal(data.total)
+  }, [data])
 
   const filteredOrders = useMemo(() => {
     if (!mockOrders || mockOrders.length === 0) return []
 
+    // Free-text search applies to the loaded page
     const result = mockOrders.filter(order => {
       const clientName = order.client?.full_name || ""
       const clientEmail = order.client?.email || ""
@@ -35,60 +68,31 @@ export default function OrdersPage() {
         clientPhone.includes(searchTerm) ||
         order._id.includes(searchTerm)
 
-      const matchesStatus =
-        statusFilter === "all" || order.status === statusFilter
-
-      const createdAt = new Date(order.created_at)
-      const matchesDate =
-        !dateRange?.from ||
-        (createdAt >= dateRange.from &&
-          (!dateRange.to || createdAt <= dateRange.to))
-
-      return matchesSearch && matchesStatus && matchesDate
+      return matchesSearch
     })
 
     return result
-  }, [mockOrders, searchTerm, statusFilter, dateRange])
+  }, [mockOrders, searchTerm])
 
+  const statusCount = (status: string) => stats?.by_status[status] ?? 0
   const statusData = [
-    { name: "En attente", value: filteredOrders.filter(o => o.status === "pending").length },
-    { name: "Accepté", value: filteredOrders.filter(o => o.status === "accepted").length },
-    { name: "Refusé", value: filteredOrders.filter(o => o.status === "declined").length },
-    { name: "Prêt", value: filteredOrders.filter(o => o.status === "ready").length },
-    { name: "En livraison", value: filteredOrders.filter(o => o.status === "out_for_delivery").length },
-    { name: "Livré", value: filteredOrders.filter(o => o.status === "delivered").length },
+    { name: "En attente", value: statusCount("pending") },
+    { name: "Accepté", value: statusCount("accepted") },
+    { name: "Refusé", value: statusCount("declined") },
+    { name: "Prêt", value: statusCount("ready") },
+    { name: "En livraison", value: statusCount("out_for_delivery") },
+    { name: "Livré", value: statusCount("delivered") },
   ]
-  // Calculate daily orders from real data
-  const dailyOrdersData = (() => {
-    if (!mockOrders || mockOrders.length === 0) {
-      return [
-        { name: "Lun", value: 0 },
-        { name: "Mar", value: 0 },
-        { name: "Mer", value: 0 },
-        { name: "Jeu", value: 0 },
-        { name: "Ven", value: 0 },
-        { name: "Sam", value: 0 },
-        { name: "Dim", value: 0 },
-      ];
-    }
-
-    const daysOfWeek = ["Dim", "Lun", "Mar", "Mer", "Jeu", "Ven", "Sam"];
-    const dailyCounts = new Array(7).fill(0);
-
-    mockOrders.forEach(order => {
-      const orderDate = new Date(order.created_at);
-      const dayOfWeek = orderDate.getDay(); // 0 = Sunday, 1 = Monday, etc.
-      dailyCounts[dayOfWeek]++;
-    });
-
-    return daysOfWeek.map((day, index) => ({
-      name: day,
-      value: dailyCounts[index]
-    }));
-  })();
+  // by_weekday starts on Sunday, like Date.getDay()
+  const daysOfWeek = ["Dim", "Lun", "Mar", "Mer", "Jeu", "Ven", "Sam"]
+  const dailyOrdersData = daysOfWeek.map((day, index) => ({
+    name: day,
+    value: stats?.by_weekday[index] ?? 0,
+  }))
 
   const handleRefresh = () => {
     refetch()
+    refetchStats()
     console.log("Refreshing orders...")
   }
 
@@ -111,7 +115,7 @@ export default function OrdersPage() {
         />
 
         {/* Charts */}
-        {isLoading ? (
+        {statsLoading ? (
           <div className="grid grid-cols-1 lg:grid-cols-2 gap-6">
             <ChartLoading />
             <ChartLoading />
@@ -121,7 +125,9 @@ export default function OrdersPage() {
             <Card>
               <CardHeader>
                 <CardTitle>Répartition par statut</CardTitle>
-                <CardDescription>Commandes filtrées par statut</CardDescription>
+                <CardDescription>
+                  Toutes les commandes filtrées{stats && ` (${stats.total})`}, toutes pages confondues
+                </CardDescription>
               </CardHeader>
               <CardContent>
                 <PieChartComponent data={statusData} className="h-48" />
@@ -131,7 +137,7 @@ export default function OrdersPage() {
             <Card>
               <CardHeader>
                 <CardTitle>Commandes par jour</CardTitle>
-                <CardDescription>Activité de la semaine</CardDescription>
+                <CardDescription>Toutes les commandes filtrées, par jour de la semaine</CardDescription>
             </CardHeader>
               <CardContent>
                 <BarChartComponent data={dailyOrdersData} className="h-48" />
@@ -151,7 +157,34 @@ export default function OrdersPage() {
             message="Impossible de charger la liste des commandes. Veuillez réessayer."
           />
         ) : (
-          <OrdersTable orders={filteredOrders} />
+          <>
+            <OrdersTable orders={filteredOrders} />
+            <div className="flex items-center justify-between">
+              <p className="text-sm text-muted-foreground">
+                Page {page + 1}
+                {total !== undefined && ` · ${total} commandes`}
+                {searchTerm.trim() !== "" && " · la recherche ne porte que sur cette page"}
+              </p>
+              <div className="flex gap-2">
+                <Button
+                  variant="outline"
+                  size="sm"
+                  disabled={page === 0}
+                  onClick={() => setCursors(cursors.slice(0, -1))}
+                >
+                  Précédent
+                </Button>
+                <Button
+                  variant="outline"
+                  size="sm"
+                  disabled={!data?.nextCursor}
+                  onClick={() => setCursors([...cursors, data?.nextCursor])}
+                >
+                  Suivant
+                </Button>
+              </div>
+            </div>
+          </>
         )}
       </div>
     </AdminLayout>
@@ -48,7 +48,7 @@ export default function OrdersHeader({
         <div className="relative flex-1">
           <Search className="absolute left-3 top-1/2 transform -translate-y-1/2 text-gray-400 w-4 h-4" />
           <Input
-            placeholder="Rechercher par nom, email ou ID de commande..."
+            placeholder="Rechercher dans la page affichée (nom, email ou ID)..."
             className="pl-10"
             value={searchTerm}
             onChange={(e) => setSearchTerm(e.target.value)}
@@ -1,5 +1,5 @@
-import { get_order_by_admin, get_order_per_student, make_order_accepted, make_order_declined, delete_order, make_order_delivered, make_order_printed, make_order_ready } from "@/lib/api/order";
-import { useMutation, useQuery, useQueryClient } from "@tanstack/react-query";
+import { AdminOrderFilters, get_admin_order_stats, get_order_by_admin, get_order_per_student, make_order_accepted, make_order_declined, delete_order, make_order_delivered, make_order_printed, make_order_ready } from "@/lib/api/order";
+import { keepPreviousData, useMutation, useQuery, useQueryClient } from "@tanstack/react-query";
 
 export function useOrdersForStudent(studentId: string) {
   return useQuery({
@@ -11,12 +11,23 @@ export function useOrdersForStudent(studentId: string) {
   })
 }
 
-export function useOrdersForAdmin() {
+export function useOrdersForAdmin(filters: AdminOrderFilters, after?: string) {
   return useQuery({
-    queryKey: ['orders'],
-    queryFn: () => get_order_by_admin(),
+    queryKey: ['orders', 'admin', filters, after ?? null],
+    queryFn: () => get_order_by_admin(filters, after),
     staleTime: 1000 * 60 * 5,
     retry: false,
+    placeholderData: keepPreviousData,
+  })
+}
+
+export function useAdminOrderStats(filters: AdminOrderFilters) {
+  return useQuery({
+    queryKey: ['orders', 'admin', 'stats', filters],
+    queryFn: () => get_admin_order_stats(filters),
+    staleTime: 1000 * 60 * 5,
+    retry: false,
+    placeholderData: keepPreviousData,
   })
 }
 
@@ -9,8 +9,51 @@ export async function get_order_per_student(
     return data;
 }
 
-export async function get_order_by_admin(): Promise<AdmindOrder[]> {
-    const { data } = await client.get<AdmindOrder[]>(API_ENDPOINTS.ORDERS.GET_ADMIN_ORDERS);
+export interface AdminOrderFilters {
+    status?: string;
+    wilaya?: string;
+    delivery_type?: string;
+    created_from?: string;
+    created_to?: string;
+    guest?: boolean;
+}
+
+export interface AdminOrdersPage {
+    orders: AdmindOrder[];
+    nextCursor?: string;
+    // Only sent with the first page
+    total?: number;
+}
+
+// One cursor-paginated page; pass nextCursor back as `after` for the next one
+export async function get_order_by_admin(
+    filters?: AdminOrderFilters,
+    after?: string,
+    limit = 50,
+): Promise<AdminOrdersPage> {
+    const { data, headers } = await client.get<AdmindOrder[]>(API_ENDPOINTS.ORDERS.GET_ADMIN_ORDERS, {
+        params: { ...filters, after, limit },
+    });
+    const total = headers["x-total-count"];
+    return {
+        orders: data,
+        nextCursor: headers["x-next-cursor"] || undefined,
+        total: total !== undefined ? Number(total) : undefined,
+    };
+}
+
+export interface AdminOrderStats {
+    total: number;
+    by_status: Record<string, number>;
+    // Sunday first
+    by_weekday: number[];
+}
+
+// Counts over every order the filters match, not just the loaded page
+export async function get_admin_order_stats(filters?: AdminOrderFilters): Promise<AdminOrderStats> {
+    const { data } = await client.get<AdminOrderStats>(API_ENDPOINTS.ORDERS.ADMIN_ORDER_STATS, {
+        params: filters,
+    });
     return data;
 }
 
@@ -121,3 +121,40 @@ export const deleteProduct = async (id: string): Promise<{ message: string; id:
   );
   return response.data;
 };
+
+interface ImageUpload {
+  image_id: string;
+  upload_url: string;
+  method: 'PUT';
+  headers: Record<string, string>;
+  expires_in: number;
+}
+
+// Uploads images straight to storage with presigned URLs, then asks the API
+// to verify them and attach them to the product.
+export const uploadProductImages = async (id: string, images: File[]): Promise<Product> => {
+  const { data } = await client.post<{ uploads: ImageUpload[] }>(
+    API_ENDPOINTS.PRODUCTS.IMAGE_UPLOADS,
+    {
+      files: images.map((image) => ({ filename: image.name, content_type: image.type })),
+    }
+  );
+
+  await Promise.all(
+    data.uploads.map(async (upload, index) => {
+      const response = await fetch(upload.upload_url, {
+        method: upload.method,
+        headers: upload.headers,
+        body: images[index],
+      });
+      if (!response.ok) {
+        throw new Error(`Failed to upload ${images[index].name}`);
+      }
+    })
+  );
+
+  const response = await client.post<Product>(API_ENDPOINTS.PRODUCTS.CONFIRM_IMAGES(id), {
+    image_ids: data.uploads.map((upload) => upload.image_id),
+  });
+  return response.data;
+};
@@ -23,10 +23,13 @@ export const API_ENDPOINTS = {
     ROOT: '/products/',
     BY_ID: (id: string) => `/products/${id}`,
     GET_IMAGE: (imageId: string) => `/products/images/${imageId}`,
+    IMAGE_UPLOADS: '/products/images/uploads',
+    CONFIRM_IMAGES: (id: string) => `/products/${id}/images`,
   },
   ORDERS: {
     ROOT: '/orders',
     GET_ADMIN_ORDERS: 'orders/get_admin_orders',
+    ADMIN_ORDER_STATS: '/orders/admin/stats',
     ACCEPT_ORDER: (id: string) => `/orders/admin/${id}/accept`,
     DECLINE_ORDER: (id: string) => `/orders/admin/${id}/decline`,
     DELETE_ORDER: (id: string) => `/orders/admin/${id}`,
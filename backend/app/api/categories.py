@@ -1,8 +1,11 @@
 from app.models.category import Category, CategoryCreate, CategoryUpdate
-from fastapi import APIRouter, HTTPException, Form
+from fastapi import APIRouter, HTTPException, Form, Request
 from typing import List, Optional
 from app.models.user import User, Role
 from app.deps.auth import role_required
+from app.cache import category_cache, make_key
+from app.http_cache import CATEGORY_CACHE_CONTROL, cache_headers, item_version, not_modified, weak_etag
+from app.serializers import ORJSONResponse, serialize_category
 from bson import ObjectId
 
 router = APIRouter(prefix="/categories", tags=["Categories"])
@@ -20,45 +23,53 @@ async def create_category(
         description=description
     )
     await category.insert()
-    return {
-        "id": str(category.id),
-        "title": category.title,
-        "description": category.description,
-        "created_at": category.created_at
-    }
+    category_cache.invalidate_tags("list")
+    return ORJSONResponse(serialize_category(category))
 
 
 @router.get("/", response_model=List[dict])
-async def get_categories():
+async def get_categories(request: Request):
     """Get all categories (public endpoint, no authentication required)"""
+    cache_key = make_key("list")
+    result = category_cache.get(cache_key)
+    if result is None:
+        result = await _load_categories()
+        category_cache.set(cache_key, result, tags=["list"])
+
+    etag = weak_etag(item_version(item) for item in result)
+    cached_response = not_modified(request, etag, CATEGORY_CACHE_CONTROL)
+    if cached_response is not None:
+        return cached_response
+    return ORJSONResponse(result, headers=cache_headers(etag, CATEGORY_CACHE_CONTROL))
+
+
+async def _load_categories() -> List[dict]:
     categories = await Category.find_all().to_list()
-    return [
-        {
-            "id": str(cat.id),
-            "title": cat.title,
-            "description": cat.description,
-            "created_at": cat.created_at
-        }
-        for cat in categories
-    ]
+    return [serialize_category(category) for category in categories]
 
 
 @router.get("/{category_id}", response_model=dict)
-async def get_category_by_id(category_id: str):
+async def get_category_by_id(category_id: str, request: Request):
     """Get category by ID (public endpoint, no authentication required)"""
     if not ObjectId.is_valid(category_id):
         raise HTTPException(status_code=400, detail="Invalid category ID")
 
-    category = await Category.get(category_id)
-    if not category:
-        raise HTTPException(status_code=404, detail="Category not found")
+    cache_key = make_key("id", category_id)
+    result = category_cache.get(cache_key)
+    if result is None:
+        category = await Category.get(category_id)
+        if not category:
+            raise HTTPException(status_code=404, detail="Category not found")
+
+        result = serialize_category(category)
+        category_cache.set(cache_key, result, tags=[f"category:{category_id}"])
 
-    return {
-        "id": str(category.id),
-        "title": category.title,
-        "description": category.description,
-        "created_at": category.created_at
-    }
+    version = item_version(result)
+    etag = weak_etag([version])
+    cached_response = not_modified(request, etag, CATEGORY_CACHE_CONTROL, version[1])
+    if cached_response is not None:
+        return cached_response
+    return ORJSONResponse(result, headers=cache_headers(etag, CATEGORY_CACHE_CONTROL, version[1]))
 
 
 @router.patch("/{category_id}", response_model=dict)
@@ -82,12 +93,8 @@ async def update_category(
         category.description = description
 
     await category.save()
-    return {
-        "id": str(category.id),
-        "title": category.title,
-        "description": category.description,
-        "created_at": category.created_at
-    }
+    category_cache.invalidate_tags("list", f"category:{category_id}")
+    return ORJSONResponse(serialize_category(category))
 
 
 @router.delete("/{category_id}", response_model=dict)
@@ -104,4 +111,5 @@ async def delete_category(
         raise HTTPException(status_code=404, detail="Category not found")
 
     await category.delete()
+    category_cache.invalidate_tags("list", f"category:{category_id}")
     return {"message": "Category deleted successfully", "id": category_id}
\ No newline at end of file
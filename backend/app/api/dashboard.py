@@ -10,6 +10,8 @@ from app.models.products import Product
 from app.services.user import UserService
 from app.services.order_service import orderService
 from app.services.product import ProductService
+from app import image_cache
+from app.cache import cache_stats
 
 
 router = APIRouter(prefix="/dashboard", tags=["Dashboard"])
@@ -70,11 +72,7 @@ async def get_dashboard_analytics(
                 month_name = order.created_at.strftime("%b")
                 monthly_orders_map[month_name] += 1
 
-                order_revenue = 0
-                for product_link, quantity in order.item:
-                    if product_link:
-                        order_revenue += product_link.price_dzd * quantity
-                monthly_revenue_map[month_name] += order_revenue
+                monthly_revenue_map[month_name] += order.total_dzd
 
         monthly_orders = [
             MonthlyOrder(month=month, count=count)
@@ -102,3 +100,15 @@ async def get_dashboard_analytics(
             status_code=500,
             detail="An error occurred while fetching dashboard analytics."
         )
+
+
+
+@router.get("/cache-stats")
+async def get_cache_stats(
+    user: User = role_required(Role.ADMIN, Role.Super_Admin)
+):
+    """Hit/miss/eviction counters of this worker's catalog and image caches"""
+    stats = cache_stats()
+    if image_cache.image_disk_cache is not None:
+        stats.append(image_cache.image_disk_cache.stats())
+    return stats
@@ -1,13 +1,23 @@
-from fastapi import APIRouter, HTTPException, Body
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Body, Query, Response
+from typing import Annotated, List, Optional
 from datetime import datetime
 from app.services.order_service import orderService
-from app.models.order import Order, OrderCreate, OrderStatus, orderResponse, serialize_order, serialize_order_F, DeliveryType, GuestOrderCreate
+from app.models.order import Order, OrderCreate, OrderFilters, OrderPage, orderResponse, DeliveryType, GuestOrderCreate
+from app.serializers import ORJSONResponse, serialize_order, serialize_order_F
 from app.models.user import User, Role
 from app.deps.auth import role_required
+from app.projection import parse_fields, projected_dict, projection_model
+from app.utils import encode_cursor
 
 router = APIRouter(prefix="/orders", tags=["Orders"])
 
+# Fields list views may project
+ORDER_LIST_FIELDS = [
+    "status", "delivery_type", "delivery_address", "delivery_phone", "zr_tracking_id",
+    "created_at", "is_guest_order", "guest_name", "guest_phone", "guest_email", "wilaya",
+    "lines", "total_dzd",
+]
+
 
 @router.post("/", response_model=orderResponse)
 async def create_order(
@@ -32,48 +42,79 @@ async def create_guest_order(order_data: GuestOrderCreate):
 
 
 @router.get("/my", response_model=List[orderResponse])
-async def get_my_orders(user: User = role_required(Role.USER, Role.ADMIN, Role.Super_Admin)):
-    orders = await orderService.get_orders_by_student(str(user.id))
+async def get_my_orders(
+    response: Response,
+    page: Annotated[OrderPage, Query()],
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. status,created_at"),
+    user: User = role_required(Role.USER, Role.ADMIN, Role.Super_Admin),
+):
+    """Newest-first page of the caller's orders, with the same pagination headers as the admin listings"""
+    projection = parse_fields(fields, ORDER_LIST_FIELDS)
+    if projection is not None:
+        orders, total = await orderService.get_orders_by_student(
+            str(user.id), page, projection=projection_model(Order, projection)
+        )
+        # Partial documents don't fit orderResponse, skip its validation
+        return ORJSONResponse(
+            [projected_dict(order, projection) for order in orders],
+            headers=page_headers(orders, total, page.limit),
+        )
+    orders, total = await orderService.get_orders_by_student(str(user.id), page)
+    response.headers.update(page_headers(orders, total, page.limit))
     return [serialize_order(order) for order in orders]
 
 
-@router.get("/get_admin_orders")
-async def get_admin_orders(user: User = role_required(Role.ADMIN, Role.Super_Admin)):
-    ReturnOrders = []
-    orders = await orderService.get_all_orders()
-
-    # Super_Admin can see all orders, regular admins only see their zone
-    if Role.Super_Admin in user.roles:
-        # Super_Admin sees all orders regardless of zone
-        for order in orders:
-            if order.is_guest_order:
-                # Guest orders don't have a student
-                ReturnOrders.append(serialize_order_F(order, None))
-            else:
-                student = await order.student.fetch() if order.student else None
-                ReturnOrders.append(serialize_order_F(order, student))
-    else:
-        # Regular admin only sees orders from their zone
-        area: str = user.era
-        for order in orders:
-            if order.is_guest_order:
-                # Include all guest orders for regular admins (or filter by wilaya)
-                ReturnOrders.append(serialize_order_F(order, None))
-            else:
-                student = await order.student.fetch() if order.student else None
-                if student and student.era == area:
-                    ReturnOrders.append(serialize_order_F(order, student))
+def page_headers(orders: List[Order], total: Optional[int], limit: int) -> dict:
+    headers = {}
+    if total is not None:
+        headers["X-Total-Count"] = str(total)
+    if len(orders) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(orders[-1].created_at, orders[-1].id)
+    return headers
+
 
-    print(f"Returning {len(ReturnOrders)} orders for user {user.email} with roles {user.roles}")
-    return ReturnOrders
+@router.get("/get_admin_orders")
+async def get_admin_orders(
+    filters: Annotated[OrderFilters, Query()],
+    user: User = role_required(Role.ADMIN, Role.Super_Admin),
+):
+    """Newest-first page of orders with their customer. The first page (no `after`)
+    returns the total matching count in `X-Total-Count`; pass `X-Next-Cursor` back
+    as `after` for the next page."""
+    # Super_Admin sees every order, regular admins guest orders and their zone
+    orders, total = await orderService.get_admin_orders(
+        user.era, filters, all_zones=Role.Super_Admin in user.roles
+    )
+    ReturnOrders = [
+        serialize_order_F(order, None if order.is_guest_order else student)
+        for order, student in orders
+    ]
+    headers = page_headers([order for order, _ in orders], total, filters.limit)
+    return ORJSONResponse(ReturnOrders, headers=headers)
+
+
+@router.get("/admin/stats")
+async def get_admin_order_stats(
+    filters: Annotated[OrderFilters, Query()],
+    user: User = role_required(Role.ADMIN, Role.Super_Admin),
+):
+    """Total, per-status and per-weekday counts of everything /orders/get_admin_orders
+    matches with the same filters, across all of its pages"""
+    return await orderService.get_admin_order_stats(
+        user.era, filters, all_zones=Role.Super_Admin in user.roles
+    )
 
 
 @router.get("/admin", response_model=List[Order])
 async def get_all_orders(
-    status: Optional[OrderStatus] = None,
+    response: Response,
+    filters: Annotated[OrderFilters, Query()],
     admin: User = role_required(Role.ADMIN, Role.Super_Admin)
 ):
-    return await orderService.get_all_orders(status)
+    """Same filters and pagination headers as /orders/get_admin_orders, across every zone"""
+    orders, total = await orderService.page_orders(orderService.build_admin_filter(filters), filters)
+    response.headers.update(page_headers(orders, total, filters.limit))
+    return orders
 
 
 @router.patch("/admin/{order_id}/accept", response_model=Order)
@@ -187,11 +228,15 @@ async def get_delivery_status(
 @router.get("/{user_id}", response_model=List[Order])
 async def get_user_orders(
     user_id: str,
+    response: Response,
+    page: Annotated[OrderPage, Query()],
     user: User = role_required(Role.ADMIN, Role.Super_Admin)
 ):
-    orders = await orderService.get_orders_by_student(user_id)
-    if not orders:
+    """Newest-first page of a customer's orders (X-Next-Cursor / X-Total-Count headers)"""
+    orders, total = await orderService.get_orders_by_student(user_id, page)
+    if not orders and not page.after:
         raise HTTPException(status_code=404, detail="No orders found for this user")
+    response.headers.update(page_headers(orders, total, page.limit))
     return [serialize_order(order) for order in orders]
 
 
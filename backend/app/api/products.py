@@ -1,22 +1,55 @@
-from datetime import datetime
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
 import os
-from fastapi import APIRouter, Query, UploadFile, File, Form, HTTPException
-from typing import List, Optional
-from fastapi.responses import StreamingResponse
-from app.models.products import Product, ProductCreate, ProductUpdate
+from fastapi import APIRouter, Header, Query, Request, Response, UploadFile, File, Form, HTTPException
+from typing import List, Literal, Optional
+from fastapi.responses import RedirectResponse, StreamingResponse
+from app.models.products import (
+    ImageUploadConfirm, ImageUploadRequest, Product, ProductBatchRequest, ProductCreate, ProductUpdate,
+)
+from app.serializers import ORJSONResponse, serialize_product
 from app.models.user import Role, User
 from app.deps.auth import role_required
 import uuid
-from app.minio import ImageBucket
+from app.minio import ImageBucket, PartialUploadError
+from app.image_variants import MODERN_FORMATS, choose_variant
+from app import exceptions, image_cache
+from app.config import settings
+from app.services.product import ProductService
+from app.services.product_import import ProductImportService
+from app.services.product_images import ProductImageService
+from app.utils import clean_param, encode_cursor
+from app.cache import (
+    image_validator_cache, invalidate_product, make_key, missing_image_cache, presigned_url_cache,
+    product_cache, product_list_tag, product_tag,
+)
+from app.http_cache import (
+    CATALOG_ITEM_CACHE_CONTROL, CATALOG_LIST_CACHE_CONTROL, IMAGE_CACHE_CONTROL, IMAGE_FALLBACK_CACHE_CONTROL,
+    cache_headers, item_version, not_modified, weak_etag,
+)
+from app.projection import parse_fields, projected_dict
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/products", tags=["Products"])
 
 image_bucket = ImageBucket(file_prefix="products/images")
 
+PRODUCT_FIELDS = [
+    "title", "sku", "description", "image_urls", "category", "price_dzd", "stock_quantity",
+    "brand", "sizes", "colors", "weight", "created_at", "updated_at",
+]
+# Needed for the cursor and the ETag, so every projection keeps them
+PRODUCT_ALWAYS_FIELDS = ["created_at", "updated_at"]
+
 
 @router.get("/", response_model=List[dict])
 async def get_products(
+    request: Request,
     title: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
     min_price: Optional[float] = Query(None),
@@ -24,76 +57,162 @@ async def get_products(
     brand: Optional[str] = Query(None),
     skip: int = 0,
     limit: int = 50,
+    after: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. title,price_dzd,image_urls"),
 ):
-    """Get all products with optional filters (public endpoint, no authentication required)"""
-    query = {}
-    
-    if title:
-        query["title"] = {"$regex": f".*{title}.*", "$options": "i"}
-    
-    if category:
-        query["category"] = category
-    
-    if brand:
-        query["brand"] = {"$regex": f".*{brand}.*", "$options": "i"}
-    
-    if min_price is not None or max_price is not None:
-        query["price_dzd"] = {}
-        if min_price is not None:
-            query["price_dzd"]["$gte"] = min_price
-        if max_price is not None:
-            query["price_dzd"]["$lte"] = max_price
-    
-    products = await Product.find(query).sort("-created_at").skip(skip).limit(limit).to_list()
-    
-    return [
-        {
-            "id": str(product.id),
-            "title": product.title,
-            "description": product.description,
-            "image_urls": product.image_urls,
-            "category": product.category,
-            "price_dzd": product.price_dzd,
-            "stock_quantity": product.stock_quantity,
-            "brand": product.brand,
-            "sizes": product.sizes,
-            "colors": product.colors,
-            "weight": product.weight,
-            "created_at": product.created_at
-        }
-        for product in products
-    ]
+    """Get all products with optional filters (public endpoint, no authentication required).
+    `title` searches title, brand and description and ranks results by relevance;
+    when no whole word matches, the searched words are matched as word prefixes.
+    Newest-first listings return an `X-Next-Cursor` header; pass it back as `after`
+    to fetch the next page without skipping over the previous ones.
+    `fields` limits the returned fields; id, created_at and updated_at are always included."""
+    # Cleaned once so the cache key, its tag and the Mongo filter all agree
+    title, category, brand = clean_param(title), clean_param(category), clean_param(brand)
+    if after:
+        skip = 0
+    projection = parse_fields(fields, PRODUCT_FIELDS, PRODUCT_ALWAYS_FIELDS)
+    cache_key = make_key(
+        "list", title=title, category=category, min_price=min_price,
+        max_price=max_price, brand=brand, skip=skip, limit=limit, after=after,
+        fields=projection,
+    )
+    result = product_cache.get(cache_key)
+    if result is None:
+        products = await ProductService.filter_products(
+            title, category, min_price, max_price, brand, skip, limit, after, projection,
+        )
+        if projection is None:
+            result = [serialize_product(product) for product in products]
+        else:
+            result = [projected_dict(product, projection) for product in products]
+        product_cache.set(cache_key, result, tags=[product_list_tag(category)])
+
+    headers = {}
+    if not title and len(result) == limit:
+        last = result[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last["created_at"], last["id"])
+
+    etag = weak_etag(item_version(item) for item in result)
+    cached_response = not_modified(request, etag, CATALOG_LIST_CACHE_CONTROL)
+    if cached_response is not None:
+        cached_response.headers.update(headers)
+        return cached_response
+    return ORJSONResponse(result, headers={**cache_headers(etag, CATALOG_LIST_CACHE_CONTROL), **headers})
+
+
+@router.get("/facets", response_model=dict)
+async def get_product_facets(
+    title: Optional[str] = Query(None),
+    category: Optional[str] = Query(None),
+    min_price: Optional[float] = Query(None),
+    max_price: Optional[float] = Query(None),
+    brand: Optional[str] = Query(None),
+    skip: int = 0,
+    limit: int = 50,
+):
+    """Same filters as GET /products, plus total and category/brand/price counts (public endpoint)"""
+    products, counts = await ProductService.facet_products(
+        title, category, min_price, max_price, brand, skip, limit
+    )
+    return ORJSONResponse({
+        "items": [serialize_product(product) for product in products],
+        **counts,
+    })
+
+
+@router.post("/batch", response_model=dict)
+async def get_products_batch(payload: ProductBatchRequest):
+    """
+    Resolve many products at once for cart and wishlist rendering (public endpoint).
+    Items come back in the requested order; unknown or invalid ids are listed in `missing`.
+    """
+    # Hex ids are case-insensitive; lookups and the cache use the canonical
+    # lowercase form, `missing` echoes ids as they were sent
+    canonical = {
+        product_id: str(ObjectId(product_id)) if ObjectId.is_valid(product_id) else None
+        for product_id in payload.ids
+    }
+    requested = list(dict.fromkeys(product_id for product_id in canonical.values() if product_id))
+    found = {}
+    to_fetch = []
+    for product_id in requested:
+        cached = product_cache.get(make_key("id", product_id))
+        if cached is not None:
+            found[product_id] = cached
+        else:
+            to_fetch.append(product_id)
+
+    for product_id, product in (await ProductService.get_products_by_ids(to_fetch)).items():
+        found[product_id] = serialize_product(product)
+        product_cache.set(make_key("id", product_id), found[product_id], tags=[product_tag(product_id)])
+
+    return ORJSONResponse({
+        "items": [found[product_id] for product_id in requested if product_id in found],
+        "missing": [product_id for product_id, key in canonical.items() if key not in found],
+    })
 
 
 @router.get("/{product_id}", response_model=dict)
-async def get_product_by_id(product_id: str):
+async def get_product_by_id(product_id: str, request: Request):
     """Get product by ID (public endpoint, no authentication required)"""
     if not ObjectId.is_valid(product_id):
         raise HTTPException(status_code=400, detail="Invalid product ID")
-    
-    product = await Product.get(product_id)
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
-    return {
-        "id": str(product.id),
-        "title": product.title,
-        "description": product.description,
-        "image_urls": product.image_urls,
-        "category": product.category,
-        "price_dzd": product.price_dzd,
-        "stock_quantity": product.stock_quantity,
-        "brand": product.brand,
-        "sizes": product.sizes,
-        "colors": product.colors,
-        "weight": product.weight,
-        "created_at": product.created_at
-    }
+    # Same cache entry, and invalidation tag, whatever the case of the hex id
+    product_id = str(ObjectId(product_id))
+
+    cache_key = make_key("id", product_id)
+    result = product_cache.get(cache_key)
+    if result is None:
+        product = await Product.get(product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+
+        result = serialize_product(product)
+        product_cache.set(cache_key, result, tags=[product_tag(product_id)])
+
+    version = item_version(result)
+    etag = weak_etag([version])
+    cached_response = not_modified(request, etag, CATALOG_ITEM_CACHE_CONTROL, version[1])
+    if cached_response is not None:
+        return cached_response
+    return ORJSONResponse(result, headers=cache_headers(etag, CATALOG_ITEM_CACHE_CONTROL, version[1]))
+
+
+async def _upload_images(images: List[UploadFile]) -> tuple[List[str], List[str], dict]:
+    """
+    Upload a request's images concurrently. Returns their object names, the
+    names this request newly wrote (the only ones it may roll back) and a
+    Server-Timing header with the total upload time.
+    """
+    if not images:
+        return [], [], {}
+    started = time.perf_counter()
+    try:
+        uploads = await image_bucket.put_many(images, settings.IMAGE_UPLOAD_CONCURRENCY)
+    except PartialUploadError as e:
+        # Deduplicated hits may be in use by a concurrent request that has
+        # not saved its product yet; they are left to the GC grace period
+        await ProductImageService.release(image_bucket, e.uploaded)
+        if isinstance(e.cause, HTTPException):
+            raise e.cause
+        raise HTTPException(status_code=500, detail=f"Failed to upload image: {str(e.cause)}")
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    image_urls = [name for name, _ in uploads]
+    written = [name for name, created in uploads if created]
+    return image_urls, written, {"Server-Timing": f'image-upload;dur={elapsed_ms:.1f};desc="{len(images)} images"'}
+
+
+def _duplicate_sku(error: Exception) -> Exception:
+    """The sku_unique index turns a reused sku into a 409 instead of a 500"""
+    if isinstance(error, DuplicateKeyError):
+        return HTTPException(status_code=409, detail="A product with this SKU already exists")
+    return error
 
 
 @router.post("/", response_model=dict)
 async def create_product(
     title: str = Form(...),
+    sku: Optional[str] = Form(None),
     description: Optional[str] = Form(None),
     category: str = Form(...),
     price_dzd: float = Form(...),
@@ -106,15 +225,7 @@ async def create_product(
     user: User = role_required(Role.ADMIN, Role.Super_Admin),
 ):
     """Create a new product with images (admin only)"""
-    image_urls = []
-    
-    # Upload images
-    for image in images:
-        try:
-            image_url = await image_bucket.put(image)
-            image_urls.append(image_url)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to upload image: {str(e)}")
+    image_urls, written, upload_timing = await _upload_images(images)
     
     # Parse comma-separated strings to lists
     sizes_list = [s.strip() for s in sizes.split(",")] if sizes else []
@@ -122,6 +233,8 @@ async def create_product(
     
     product = Product(
         title=title,
+        # Blank is no sku, as in update_product: "" would be unique too
+        sku=sku or None,
         description=description,
         image_urls=image_urls,
         category=category,
@@ -132,28 +245,36 @@ async def create_product(
         colors=colors_list,
         weight=weight
     )
-    await product.insert()
+    try:
+        await product.insert()
+    except Exception as e:
+        await ProductImageService.release(image_bucket, written)
+        raise _duplicate_sku(e)
+    invalidate_product(None, product.category)
     
-    return {
-        "id": str(product.id),
-        "title": product.title,
-        "description": product.description,
-        "image_urls": product.image_urls,
-        "category": product.category,
-        "price_dzd": product.price_dzd,
-        "stock_quantity": product.stock_quantity,
-        "brand": product.brand,
-        "sizes": product.sizes,
-        "colors": product.colors,
-        "weight": product.weight,
-        "created_at": product.created_at
-    }
+    return ORJSONResponse(serialize_product(product), headers=upload_timing)
+
+
+@router.post("/import", response_model=dict)
+async def import_products(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, description="csv or ndjson; guessed from the file name when omitted"),
+    user: User = role_required(Role.ADMIN, Role.Super_Admin),
+):
+    """
+    Bulk create or update products from a CSV or NDJSON file (admin only).
+    Columns/keys follow ProductCreate plus `image_urls` (URLs separated by `|` or
+    spaces in CSV). Rows are upserted by `sku`, or by `title` when there is no sku.
+    Returns counts and a per-row error report.
+    """
+    return await ProductImportService(image_bucket).import_file(file, format)
 
 
 @router.patch("/{product_id}", response_model=dict)
 async def update_product(
     product_id: str,
     title: Optional[str] = Form(None),
+    sku: Optional[str] = Form(None),
     description: Optional[str] = Form(None),
     category: Optional[str] = Form(None),
     price_dzd: Optional[float] = Form(None),
@@ -172,21 +293,17 @@ async def update_product(
     product = await Product.get(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
+    previous_category = product.category
     
     # Upload new images if provided
-    if images:
-        new_image_urls = []
-        for image in images:
-            try:
-                image_url = await image_bucket.put(image)
-                new_image_urls.append(image_url)
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Failed to upload image: {str(e)}")
-        product.image_urls.extend(new_image_urls)
+    new_image_urls, written, upload_timing = await _upload_images(images)
+    product.image_urls.extend(new_image_urls)
     
     # Update fields
     if title is not None:
         product.title = title
+    if sku is not None:
+        product.sku = sku or None
     if description is not None:
         product.description = description
     if category is not None:
@@ -204,22 +321,14 @@ async def update_product(
     if weight is not None:
         product.weight = weight
     
-    await product.save()
+    try:
+        await product.save()
+    except Exception as e:
+        await ProductImageService.release(image_bucket, written)
+        raise _duplicate_sku(e)
+    invalidate_product(product_id, previous_category, product.category)
     
-    return {
-        "id": str(product.id),
-        "title": product.title,
-        "description": product.description,
-        "image_urls": product.image_urls,
-        "category": product.category,
-        "price_dzd": product.price_dzd,
-        "stock_quantity": product.stock_quantity,
-        "brand": product.brand,
-        "sizes": product.sizes,
-        "colors": product.colors,
-        "weight": product.weight,
-        "created_at": product.created_at
-    }
+    return ORJSONResponse(serialize_product(product), headers=upload_timing)
 
 
 @router.delete("/{product_id}", response_model=dict)
@@ -236,18 +345,189 @@ async def delete_product(
         raise HTTPException(status_code=404, detail="Product not found")
 
     await product.delete()
+    invalidate_product(product_id, product.category)
+    await ProductImageService.release(image_bucket, product.image_urls)
     return {"message": "Product deleted successfully", "id": product_id}
 
 
+@router.post("/images/uploads")
+async def create_image_uploads(
+    payload: ImageUploadRequest,
+    user: User = role_required(Role.ADMIN, Role.Super_Admin),
+):
+    """
+    Presigned PUT URLs for uploading product images straight to storage
+    (admin only). Each uploaded image is attached with POST /{id}/images.
+    """
+    uploads = []
+    for file in payload.files:
+        image_id, url = await image_bucket.presign_upload(file.filename, file.content_type)
+        uploads.append({
+            "image_id": image_id,
+            "upload_url": url,
+            "method": "PUT",
+            "headers": {"Content-Type": file.content_type},
+            "expires_in": settings.PRESIGNED_UPLOAD_EXPIRES_SECONDS,
+        })
+    return {"uploads": uploads}
+
+
+@router.post("/{product_id}/images")
+async def confirm_image_uploads(
+    product_id: str,
+    payload: ImageUploadConfirm,
+    user: User = role_required(Role.ADMIN, Role.Super_Admin),
+):
+    """Verify directly uploaded images and attach them to a product (admin only)"""
+    if not ObjectId.is_valid(product_id):
+        raise HTTPException(status_code=400, detail="Invalid product ID")
+    product = await Product.get(product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    results = await asyncio.gather(
+        *(image_bucket.confirm_upload(image_id) for image_id in payload.image_ids),
+        return_exceptions=True,
+    )
+    errors = []
+    confirmed = []
+    written = []
+    for image_id, result in zip(payload.image_ids, results):
+        if isinstance(result, tuple):
+            content_name, created = result
+            confirmed.append(content_name)
+            if created:
+                written.append(content_name)
+        elif isinstance(result, exceptions.NotFound):
+            errors.append(f"Image {image_id} was not uploaded")
+        elif isinstance(result, HTTPException):
+            errors.append(result.detail)
+        elif isinstance(result, BaseException):
+            errors.append(f"Image {image_id} could not be verified: {result}")
+    if errors:
+        await ProductImageService.release(image_bucket, written)
+        raise HTTPException(status_code=400, detail=errors)
+
+    # Confirmed images are renamed to their content hash
+    product.image_urls.extend(i for i in dict.fromkeys(confirmed) if i not in product.image_urls)
+    await product.save()
+    invalidate_product(product_id, product.category)
+    return ORJSONResponse(serialize_product(product))
+
+
+async def _serve_image(
+    request: Request,
+    object_name: str,
+    byte_range: Optional[str],
+    extra_headers: dict,
+    cache_control: str = IMAGE_CACHE_CONTROL,
+):
+    """Serve one image object; raises exceptions.NotFound when it does not exist"""
+    conditional = "if-none-match" in request.headers or "if-modified-since" in request.headers
+    validators = image_validator_cache.get(object_name)
+    if validators is None and conditional:
+        validators = await image_bucket.stat(object_name)
+        image_validator_cache.set(object_name, validators)
+    if validators is not None and conditional:
+        etag, last_modified = validators
+        response = not_modified(request, etag, cache_control, last_modified)
+        if response is not None:
+            response.headers.update(extra_headers)
+            return response
+
+    disk_cache = image_cache.image_disk_cache
+    if disk_cache is not None:
+        try:
+            cached = await disk_cache.get(image_bucket, object_name)
+        except exceptions.NotFound:
+            raise
+        except Exception as e:
+            # The cache is only an accelerator: stream from MinIO instead
+            logger.warning(f"Image disk cache fill failed for {object_name}: {e}")
+            cached = None
+        if cached is not None:
+            headers = {"Content-Disposition": f"inline; filename={cached.filename}", **extra_headers}
+            if cached.etag is not None:
+                image_validator_cache.set(object_name, (cached.etag, cached.last_modified))
+                headers.update(cache_headers(cached.etag, cache_control, cached.last_modified))
+            # The entry stays pinned, so it can't be evicted, until it is sent.
+            # FileResponse handles Range itself
+            return disk_cache.file_response(cached, headers)
+
+    stream = await image_bucket.open(object_name, byte_range=byte_range)
+    headers = {**stream.headers(), **extra_headers}
+    if stream.etag is not None:
+        image_validator_cache.set(object_name, (stream.etag, stream.last_modified))
+        headers.update(cache_headers(stream.etag, cache_control, stream.last_modified))
+    return StreamingResponse(
+        stream.iter_chunks(),
+        status_code=stream.status_code,
+        media_type=stream.content_type,
+        headers=headers,
+    )
+
+
+async def _redirect_to_image(image_id: str, object_name: str, extra_headers: dict) -> Response:
+    """302 to a presigned MinIO URL for the variant, or the original when the variant is missing"""
+    if object_name != image_id:
+        if missing_image_cache.get(object_name) is not None:
+            object_name = image_id
+        elif image_validator_cache.get(object_name) is None:
+            try:
+                image_validator_cache.set(object_name, await image_bucket.stat(object_name))
+            except exceptions.NotFound:
+                missing_image_cache.set(object_name, True)
+                object_name = image_id
+            except Exception:
+                raise HTTPException(status_code=404, detail="Image not found")
+
+    url = presigned_url_cache.get(object_name)
+    if url is None:
+        url = await image_bucket.presigned_get(
+            object_name, timedelta(seconds=settings.PRESIGNED_GET_EXPIRES_SECONDS)
+        )
+        presigned_url_cache.set(object_name, url)
+    # A cached URL is valid for at least the refresh margin, so clients may
+    # reuse the redirect that long
+    headers = {
+        "Cache-Control": f"private, max-age={settings.PRESIGNED_GET_REFRESH_MARGIN_SECONDS}",
+        **extra_headers,
+    }
+    return RedirectResponse(url, status_code=302, headers=headers)
+
+
 @router.get("/images/{image_id}")
-async def get_product_image(image_id: str):
-    """Get product image by ID (public endpoint)"""
+async def get_product_image(
+    request: Request,
+    image_id: str,
+    w: Optional[int] = Query(None, ge=1, le=4096),
+    format: Optional[Literal["avif", "webp", "original"]] = Query(None),
+    range: Optional[str] = Header(None),
+):
+    """
+    Get product image by ID (public endpoint), streamed with Range support.
+    `w` picks the smallest generated width at least that wide; without
+    `format` the best encoding the client accepts is chosen.
+    """
+    if format is not None and format != "original" and format not in MODERN_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported image format: {format}")
+    object_name, negotiated = choose_variant(image_id, w, format, request.headers.get("accept", ""))
+    extra_headers = {"Vary": "Accept"} if negotiated else {}
+
+    if settings.IMAGE_SERVING_MODE == "redirect":
+        return await _redirect_to_image(image_id, object_name, extra_headers)
+
     try:
-        data, filename, content_type = await image_bucket.get(image_id)
-        return StreamingResponse(
-            iter([data]),
-            media_type=content_type,
-            headers={"Content-Disposition": f"inline; filename={filename}"}
-        )
-    except Exception as e:
+        # Variants appear shortly after upload (or after a backfill); until
+        # then the original is served
+        if object_name != image_id and missing_image_cache.get(object_name) is None:
+            try:
+                return await _serve_image(request, object_name, range, extra_headers)
+            except exceptions.NotFound:
+                missing_image_cache.set(object_name, True)
+        cache_control = IMAGE_CACHE_CONTROL if object_name == image_id else IMAGE_FALLBACK_CACHE_CONTROL
+        return await _serve_image(request, image_id, range, extra_headers, cache_control)
+    except exceptions.RangeNotSatisfiable:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable")
+    except Exception:
         raise HTTPException(status_code=404, detail="Image not found")
@@ -1,6 +1,6 @@
-from typing import List
+from typing import List, Optional
 from fastapi import APIRouter, BackgroundTasks
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from pydantic import BaseModel
 from app.models.user import ResetPasswordRequest, Role, UserCreate, UserLogin, UserUpdate, VerifyCodeRequest
 from app.services.auth import authenticate_user, create_access_token, get_reset_token, hash_password, verify_reset_token
@@ -10,6 +10,8 @@ from fastapi.responses import JSONResponse
 from app.config import settings
 from app.deps.auth import role_required
 from app.utils import send_email
+from app.projection import parse_fields, projected_dict, projection_model
+from app.serializers import ORJSONResponse
 from bson import ObjectId
 import random
 import datetime
@@ -155,9 +157,18 @@ async def unblock_user(user: User = role_required(Role.Super_Admin), user_id: st
     return user
 
 
+USER_LIST_FIELDS = ["email", "full_name", "phone_number", "roles", "isblocked", "created_at"]
+
+
 @router.get("/all-users", response_model=List[User])
 async def get_all_users_paginated(user: User = role_required(Role.Super_Admin),
-                                  skip: int = 0, limit: int = 10):
+                                  skip: int = 0, limit: int = 10,
+                                  fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. email,full_name")):
+    projection = parse_fields(fields, USER_LIST_FIELDS)
+    if projection is not None:
+        users = await User.find().skip(skip).limit(limit).project(projection_model(User, projection)).to_list()
+        # Partial documents don't fit the User model, skip its validation
+        return ORJSONResponse([projected_dict(u, projection) for u in users])
     return await User.find().skip(skip).limit(limit).to_list()
 
 
@@ -0,0 +1,167 @@
+"""
+In-process read cache for the public catalog endpoints.
+
+Each worker keeps its own size-bounded TTL + LRU cache. Entries carry tags so
+writes can drop exactly the entries they affect instead of the whole cache.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Set
+
+from app.config import settings
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, name: str, max_entries: int, ttl_seconds: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple[float, Any, frozenset]]" = OrderedDict()
+        self._tags: Dict[str, Set[Hashable]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        expires_at, value, _ = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[str] = ()) -> None:
+        if key in self._entries:
+            self._remove(key)
+        tags = frozenset(tags)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        if key in self._entries:
+            self._remove(key)
+            self.invalidations += 1
+
+    def invalidate_tags(self, *tags: str) -> None:
+        """Drop every entry carrying at least one of the given tags"""
+        for tag in tags:
+            for key in list(self._tags.get(tag, ())):
+                self.delete(key)
+
+    def clear(self) -> None:
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._tags.clear()
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+def make_key(*parts: Any, **params: Any) -> tuple:
+    """
+    Normalized cache key: parameters left at None are dropped and the rest are
+    sorted, so equivalent requests share one entry whatever the argument order.
+    Values are used as given; callers clean them (utils.clean_param) before
+    building both the key and the query, so the two can never disagree.
+    """
+    return (*parts, *((name, value) for name, value in sorted(params.items()) if value is not None))
+
+
+# Product lists are tagged with their category filter ("*" when unfiltered),
+# single products with their id, so a write only drops what it can affect.
+product_cache = TTLCache(
+    "products",
+    max_entries=settings.CATALOG_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.CATALOG_CACHE_TTL_SECONDS,
+)
+category_cache = TTLCache(
+    "categories",
+    max_entries=settings.CATALOG_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.CATALOG_CACHE_TTL_SECONDS,
+)
+
+# Validators (etag, last modified) of image objects. Objects are immutable, so
+# a known etag can answer If-None-Match without asking MinIO.
+image_validator_cache = TTLCache(
+    "image-validators",
+    max_entries=settings.IMAGE_VALIDATOR_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.IMAGE_VALIDATOR_CACHE_TTL_SECONDS,
+)
+
+# Image variants looked up but not generated yet, so each view of an image
+# that predates the variant pipeline does not cost a failed MinIO GET.
+missing_image_cache = TTLCache(
+    "missing-images",
+    max_entries=settings.IMAGE_VALIDATOR_CACHE_MAX_ENTRIES,
+    ttl_seconds=300,
+)
+
+# Presigned GET URLs for the redirect serving mode, dropped a margin before
+# they expire so a redirect never points at a URL about to go stale.
+presigned_url_cache = TTLCache(
+    "presigned-urls",
+    max_entries=settings.IMAGE_VALIDATOR_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.PRESIGNED_GET_EXPIRES_SECONDS - settings.PRESIGNED_GET_REFRESH_MARGIN_SECONDS,
+)
+
+
+def product_list_tag(category: Optional[str]) -> str:
+    return f"list:{category if category is not None else '*'}"
+
+
+def product_tag(product_id: str) -> str:
+    return f"product:{product_id}"
+
+
+def invalidate_product(product_id: Optional[str], *categories: Optional[str]) -> None:
+    """Drop a product's own entry and every list it may have appeared in"""
+    if product_id is not None:
+        product_cache.invalidate_tags(product_tag(product_id))
+    product_cache.invalidate_tags(
+        product_list_tag(None),
+        *(product_list_tag(c) for c in set(categories) if c is not None),
+    )
+
+
+def cache_stats() -> list:
+    return [
+        product_cache.stats(),
+        category_cache.stats(),
+        image_validator_cache.stats(),
+        missing_image_cache.stats(),
+        presigned_url_cache.stats(),
+    ]
@@ -1,4 +1,5 @@
 import os
+from typing import Literal
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from fastapi_mail import ConnectionConfig
@@ -39,6 +40,38 @@ class Settings(BaseSettings):
     ZR_EXPRESS_TOKEN: str = Field(default="dummy")
     ZR_EXPRESS_KEY: str = Field(default="dummy")
 
+    # In-process cache for the public catalog endpoints (per worker)
+    CATALOG_CACHE_TTL_SECONDS: float = Field(default=60)
+    CATALOG_CACHE_MAX_ENTRIES: int = Field(default=1024)
+    IMAGE_VALIDATOR_CACHE_TTL_SECONDS: float = Field(default=24 * 3600)
+    IMAGE_VALIDATOR_CACHE_MAX_ENTRIES: int = Field(default=20000)
+
+    # Optional on-disk image cache in front of MinIO (disabled when no dir is set)
+    IMAGE_DISK_CACHE_DIR: str = Field(default="")
+    IMAGE_DISK_CACHE_MAX_BYTES: int = Field(default=2 * 1024 * 1024 * 1024)
+    IMAGE_DISK_CACHE_MAX_OBJECT_BYTES: int = Field(default=20 * 1024 * 1024)
+    # Direct-to-storage image uploads
+    PRESIGNED_UPLOAD_EXPIRES_SECONDS: int = Field(default=15 * 60)
+    IMAGE_UPLOAD_MAX_BYTES: int = Field(default=10 * 1024 * 1024)
+    DOCUMENT_UPLOAD_MAX_BYTES: int = Field(default=25 * 1024 * 1024)
+    # Whole request bodies of the multipart product routes, checked as they arrive
+    PRODUCT_FORM_MAX_BYTES: int = Field(default=100 * 1024 * 1024)
+    PRODUCT_IMPORT_MAX_BYTES: int = Field(default=100 * 1024 * 1024)
+    # Parallel MinIO uploads per product create/update request
+    IMAGE_UPLOAD_CONCURRENCY: int = Field(default=4)
+    # "stream" relays image bytes through the API; "redirect" answers with a
+    # 302 to a presigned MinIO URL and needs MinIO reachable by clients
+    IMAGE_SERVING_MODE: Literal["stream", "redirect"] = Field(default="stream")
+    PRESIGNED_GET_EXPIRES_SECONDS: int = Field(default=3600)
+    # Cached presigned URLs are replaced this long before they expire
+    PRESIGNED_GET_REFRESH_MARGIN_SECONDS: int = Field(default=300)
+    # Orphaned image sweeper; 0 disables the periodic run
+    IMAGE_GC_INTERVAL_SECONDS: int = Field(default=24 * 3600)
+    IMAGE_GC_GRACE_SECONDS: int = Field(default=24 * 3600)
+    IMAGE_GC_DRY_RUN: bool = Field(default=False)
+    # Worker processes that render resized/WebP/AVIF image variants
+    IMAGE_VARIANT_WORKERS: int = Field(default=2)
+
     model_config = SettingsConfigDict(
         case_sensitive=True,
         extra="allow",  
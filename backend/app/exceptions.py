@@ -64,6 +64,10 @@ class NotFound(HTTPBaseException):
     code = status.HTTP_404_NOT_FOUND
     message = "Not found"
 
+class RangeNotSatisfiable(HTTPBaseException):
+    code = status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+    message = "Requested range not satisfiable"
+
 class BadRequest(HTTPBaseException):
     code = status.HTTP_400_BAD_REQUEST
     message = "Bad request"
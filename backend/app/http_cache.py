@@ -0,0 +1,89 @@
+"""
+HTTP conditional caching helpers for the catalog endpoints.
+
+Routes compute a weak ETag (and Last-Modified for single resources) from the
+ids and `updated_at` of what they would return, then call `not_modified()`
+before building the body so a revalidation costs no serialization at all.
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Optional
+
+from fastapi import Request, Response
+
+# Cache-Control policy per route family. Lists change whenever any product
+# does, so they are kept short and revalidated with the ETag.
+CATALOG_LIST_CACHE_CONTROL = "public, max-age=30, stale-while-revalidate=60"
+CATALOG_ITEM_CACHE_CONTROL = "public, max-age=60, stale-while-revalidate=300"
+CATEGORY_CACHE_CONTROL = "public, max-age=300, stale-while-revalidate=600"
+# Images live under random object names that are never rewritten.
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# The original served in place of a variant not generated yet: the URL will
+# soon return the variant, so it must not be pinned in caches.
+IMAGE_FALLBACK_CACHE_CONTROL = "public, max-age=60"
+
+
+def weak_etag(versions: Iterable[tuple]) -> str:
+    """Weak ETag over (id, last modification) pairs, in response order"""
+    digest = hashlib.sha1()
+    for document_id, modified_at in versions:
+        digest.update(f"{document_id}:{modified_at.isoformat() if modified_at else ''};".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def item_version(item: dict) -> tuple:
+    """(id, last modification) of a serialized document; old documents lack updated_at"""
+    return item["id"], item.get("updated_at") or item["created_at"]
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Documents store naive UTC datetimes
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def cache_headers(
+    etag: str, cache_control: str, last_modified: Optional[datetime] = None
+) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(_as_utc(last_modified), usegmt=True)
+    return headers
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" designate the same representation
+    wanted = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in wanted
+
+
+def not_modified(
+    request: Request,
+    etag: str,
+    cache_control: str,
+    last_modified: Optional[datetime] = None,
+) -> Optional[Response]:
+    """
+    Return a 304 response when the client's validators still match, else None.
+    If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2).
+    """
+    headers = cache_headers(etag, cache_control, last_modified)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        return None
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return None
+        if _as_utc(last_modified).replace(microsecond=0) <= _as_utc(since):
+            return Response(status_code=304, headers=headers)
+    return None
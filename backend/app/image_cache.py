@@ -0,0 +1,285 @@
+"""
+Optional on-disk LRU cache in front of MinIO for product images.
+
+Enabled by setting IMAGE_DISK_CACHE_DIR. Each cached object is a data file
+plus a small JSON sidecar with the headers needed to serve it; both are
+written to a temp file and renamed into place so readers never see a partial
+file. Concurrent misses on the same object share one MinIO fetch, and hits
+are served with FileResponse so the bytes go from disk to the socket. An
+entry is pinned while a response reads it; evicting a pinned entry drops it
+from the index at once but deletes its files only when the last reader is
+done.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+from app.config import settings
+from app.minio import Bucket, ObjectStream
+
+logger = logging.getLogger(__name__)
+
+
+class _TooLarge(Exception):
+    pass
+
+
+@dataclass
+class CachedImage:
+    path: str
+    size: int
+    content_type: str
+    filename: str
+    etag: Optional[str]
+    last_modified: Optional[datetime]
+
+
+class DiskImageCache:
+    def __init__(self, root: str, max_bytes: int, max_object_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+        self._entries: "OrderedDict[str, CachedImage]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Reader counts by data path, and pinned paths evicted meanwhile
+        self._pins: Dict[str, int] = {}
+        self._doomed: Set[str] = set()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fills = 0
+        self.fill_errors = 0
+        self.evictions = 0
+        self.skipped = 0
+
+    def load(self) -> None:
+        """Index what a previous run left on disk, least recently used first"""
+        os.makedirs(self.root, exist_ok=True)
+        found = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith(".tmp"):
+                os.unlink(path)
+                continue
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(path) as f:
+                    meta = json.load(f)
+                data_path = path[: -len(".json")]
+                found.append((os.stat(data_path).st_atime, meta["key"], self._entry(data_path, meta)))
+            except (OSError, ValueError, KeyError):
+                self._unlink(path[: -len(".json")])
+        for _, key, entry in sorted(found, key=lambda item: item[0]):
+            self._entries[key] = entry
+            self.total_bytes += entry.size
+        self._evict()
+        logger.info(f"Image disk cache at {self.root}: {len(self._entries)} objects, {self.total_bytes} bytes")
+
+    @staticmethod
+    def _entry(path: str, meta: dict) -> CachedImage:
+        last_modified = meta.get("last_modified")
+        return CachedImage(
+            path=path,
+            size=meta["size"],
+            content_type=meta["content_type"],
+            filename=meta["filename"],
+            etag=meta.get("etag"),
+            last_modified=datetime.fromisoformat(last_modified) if last_modified else None,
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, hashlib.sha256(key.encode()).hexdigest())
+
+    async def get(self, bucket: Bucket, object_name: str) -> Optional[CachedImage]:
+        """
+        Return the cached copy of an object, fetching it on a miss, pinned:
+        the caller must `unpin` it (or serve it with `file_response`). Returns
+        None when the object is too large to cache or was evicted before it
+        could be pinned; the caller then streams it. Raises whatever
+        Bucket.open raises (NotFound, ...).
+        """
+        key = f"{bucket.bucket_name}/{bucket.file_prefix}/{object_name}"
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self._pin(entry)
+            return entry
+
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fill(key, bucket, object_name))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._fill_done(key, done))
+        else:
+            self.coalesced += 1
+        # shield: a waiter that disconnects must not cancel the shared fetch
+        entry = await asyncio.shield(task)
+        # Other fills may have evicted it between the fill and this waiter
+        if entry is None or self._entries.get(key) is not entry:
+            return None
+        self._pin(entry)
+        return entry
+
+    def _pin(self, entry: CachedImage) -> None:
+        self._pins[entry.path] = self._pins.get(entry.path, 0) + 1
+
+    def unpin(self, entry: CachedImage) -> None:
+        count = self._pins.pop(entry.path) - 1
+        if count:
+            self._pins[entry.path] = count
+        elif entry.path in self._doomed:
+            self._doomed.discard(entry.path)
+            self._unlink(f"{entry.path}.json")
+            self._unlink(entry.path)
+
+    def file_response(self, entry: CachedImage, headers: dict) -> FileResponse:
+        """FileResponse for a pinned entry that unpins it once sent, or if sending fails"""
+        return _PinnedFileResponse(self, entry, headers)
+
+    async def _fill(self, key: str, bucket: Bucket, object_name: str) -> Optional[CachedImage]:
+        stream = await bucket.open(object_name)
+        if stream.content_length is not None and int(stream.content_length) > self.max_object_bytes:
+            stream.response.close()
+            self.skipped += 1
+            return None
+        try:
+            return await self._write(key, stream)
+        except _TooLarge:
+            # No Content-Length to tell up front
+            self.skipped += 1
+            return None
+
+    async def _write(self, key: str, stream: ObjectStream) -> CachedImage:
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in stream.iter_chunks():
+                    size += len(chunk)
+                    if size > self.max_object_bytes:
+                        raise _TooLarge
+                    await asyncio.to_thread(f.write, chunk)
+            entry = CachedImage(
+                path=path,
+                size=size,
+                content_type=stream.content_type,
+                filename=stream.filename,
+                etag=stream.etag,
+                last_modified=stream.last_modified,
+            )
+            meta = asdict(entry)
+            del meta["path"]
+            meta["key"] = key
+            meta["last_modified"] = entry.last_modified.isoformat() if entry.last_modified else None
+            await asyncio.to_thread(self._commit, tmp_path, path, meta)
+        except _TooLarge:
+            stream.response.close()
+            self._unlink(tmp_path)
+            raise
+        except BaseException:
+            self.fill_errors += 1
+            self._unlink(tmp_path)
+            raise
+        # The new file replaced any evicted one still being read at this path
+        self._doomed.discard(path)
+
+        self.fills += 1
+        self._entries[key] = entry
+        self.total_bytes += size
+        self._evict(keep=key)
+        return entry
+
+    def _fill_done(self, key: str, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            # Mark the exception retrieved even if every waiter went away
+            task.exception()
+
+    def _commit(self, tmp_path: str, path: str, meta: dict) -> None:
+        os.replace(tmp_path, path)
+        fd, tmp_meta = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, f"{path}.json")
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        while self.total_bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            entry = self._entries.pop(key)
+            self.total_bytes -= entry.size
+            self.evictions += 1
+            if entry.path in self._pins:
+                self._doomed.add(entry.path)
+                continue
+            self._unlink(f"{entry.path}.json")
+            self._unlink(entry.path)
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "name": "image-disk",
+            "size": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "coalesced": self.coalesced,
+            "fills": self.fills,
+            "fill_errors": self.fill_errors,
+            "evictions": self.evictions,
+            "skipped_too_large": self.skipped,
+            "pinned": len(self._pins),
+        }
+
+
+class _PinnedFileResponse(FileResponse):
+    def __init__(self, cache: DiskImageCache, entry: CachedImage, headers: dict):
+        super().__init__(entry.path, media_type=entry.content_type, headers=headers)
+        self._cache = cache
+        self._entry = entry
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._cache.unpin(self._entry)
+
+
+image_disk_cache: Optional[DiskImageCache] = None
+
+
+def init_image_disk_cache() -> Optional[DiskImageCache]:
+    global image_disk_cache
+    if settings.IMAGE_DISK_CACHE_DIR:
+        image_disk_cache = DiskImageCache(
+            settings.IMAGE_DISK_CACHE_DIR,
+            max_bytes=settings.IMAGE_DISK_CACHE_MAX_BYTES,
+            max_object_bytes=settings.IMAGE_DISK_CACHE_MAX_OBJECT_BYTES,
+        )
+        image_disk_cache.load()
+    return image_disk_cache
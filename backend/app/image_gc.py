@@ -0,0 +1,161 @@
+"""
+Garbage collection of product images no product references any more.
+
+Deleted products and failed or abandoned uploads leave objects behind in the
+images bucket. The sweeper lists the bucket page by page, compares each
+object with the ids found in `Product.image_urls` and in the order line
+snapshots' `lines.image_url` (read with projection-only cursors) and removes
+what is unreferenced and older than a grace period, so
+uploads that are still being attached are never touched. Variants
+(`<id>_w200.webp`, ...) live and die with their original: they are kept
+while it is referenced or within the grace period, whatever their own age
+(a deduplicated upload only refreshes the original's timestamp).
+
+It runs periodically in the API process, in one worker at a time: each
+round takes the "image_gc" lease (app.leases), which the worker that swept
+last keeps renewing and another worker only gets once it has lapsed. It
+can also be run by hand:
+
+    python -m app.image_gc             # delete orphans
+    python -m app.image_gc --dry-run   # only report them
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import List, Set
+
+from app import leases
+from app.config import settings
+from app.minio import Bucket
+from app.models.order import Order
+from app.models.products import Product
+
+logger = logging.getLogger(__name__)
+
+GC_DELETE_BATCH_SIZE = 1000
+GC_LEASE = "image_gc"
+# Orphan names listed in a report; counts always cover everything
+MAX_REPORTED_ORPHANS = 100
+
+
+def base_image_id(object_name: str) -> str:
+    """Original image id of an object name; ids are SHA-256 digests (or UUIDs), variants add `_w…`/`.fmt`"""
+    return object_name.split("_", 1)[0].split(".", 1)[0]
+
+
+async def referenced_image_ids() -> Set[str]:
+    """Images of products and of past orders' lines, which keep showing them"""
+    collection = Product.get_pymongo_collection()
+    referenced = set()
+    cursor = collection.find({"image_urls.0": {"$exists": True}}, {"image_urls": 1, "_id": 0})
+    async for doc in cursor:
+        referenced.update(doc["image_urls"])
+    order_images = await Order.get_pymongo_collection().aggregate([
+        {"$match": {"lines.image_url": {"$type": "string"}}},
+        {"$project": {"_id": 0, "lines.image_url": 1}},
+        {"$unwind": "$lines"},
+        {"$group": {"_id": "$lines.image_url"}},
+    ])
+    async for doc in order_images:
+        if doc["_id"]:
+            referenced.add(doc["_id"])
+    return referenced
+
+
+async def sweep_images(bucket: Bucket, dry_run: bool = False, grace: timedelta | None = None) -> dict:
+    """Delete (or with dry_run, only count) unreferenced images older than `grace`"""
+    grace = grace if grace is not None else timedelta(seconds=settings.IMAGE_GC_GRACE_SECONDS)
+    # Read references before listing: anything uploaded after this point is
+    # newer than the cutoff and therefore kept
+    referenced = await referenced_image_ids()
+    cutoff = datetime.now(timezone.utc) - grace
+
+    report = {
+        "dry_run": dry_run,
+        "scanned": 0,
+        "referenced_ids": len(referenced),
+        "recent_kept": 0,
+        "orphans": 0,
+        "orphan_bytes": 0,
+        "deleted": 0,
+        "errors": [],
+        "sample": [],
+    }
+    batch: List[str] = []
+    # Originals inside the grace period; listings are in key order, so an
+    # original comes right before its `<id>.fmt` / `<id>_w…` variants
+    recent_ids: Set[str] = set()
+
+    async def flush():
+        errors = await bucket.remove_batch(batch)
+        report["deleted"] += len(batch) - len(errors)
+        report["errors"].extend(errors[: MAX_REPORTED_ORPHANS - len(report["errors"])])
+        batch.clear()
+
+    async for name, last_modified, size in bucket.iter_objects():
+        report["scanned"] += 1
+        image_id = base_image_id(name)
+        if image_id in referenced:
+            continue
+        if last_modified is None or last_modified > cutoff or image_id in recent_ids:
+            if name == image_id:
+                recent_ids.add(image_id)
+            report["recent_kept"] += 1
+            continue
+        report["orphans"] += 1
+        report["orphan_bytes"] += size or 0
+        if len(report["sample"]) < MAX_REPORTED_ORPHANS:
+            report["sample"].append(name)
+        if not dry_run:
+            batch.append(name)
+            if len(batch) >= GC_DELETE_BATCH_SIZE:
+                await flush()
+    if batch:
+        await flush()
+
+    logger.info(
+        f"Image GC{' (dry run)' if dry_run else ''}: scanned {report['scanned']}, "
+        f"orphans {report['orphans']} ({report['orphan_bytes']} bytes), deleted {report['deleted']}"
+    )
+    return report
+
+
+async def run_image_gc(bucket: Bucket) -> None:
+    """
+    Sweep every IMAGE_GC_INTERVAL_SECONDS for as long as the app runs, in
+    whichever worker holds the GC lease. The lease outlives one interval, so
+    its holder keeps it from round to round and the other workers skip until
+    the holder stops renewing it.
+    """
+    lease_ttl = timedelta(seconds=2 * settings.IMAGE_GC_INTERVAL_SECONDS)
+    while True:
+        await asyncio.sleep(settings.IMAGE_GC_INTERVAL_SECONDS)
+        try:
+            if not await leases.acquire(GC_LEASE, lease_ttl):
+                continue
+            await sweep_images(bucket, dry_run=settings.IMAGE_GC_DRY_RUN)
+        except Exception as e:
+            logger.error(f"Image GC failed: {e}")
+
+
+async def _main(dry_run: bool, grace_hours: float | None) -> int:
+    from app.api.products import image_bucket
+    from app.main import init_minio, init_mongo
+
+    await init_mongo(skip_indexes=True)
+    await init_minio()
+    grace = timedelta(hours=grace_hours) if grace_hours is not None else None
+    report = await sweep_images(image_bucket, dry_run=dry_run, grace=grace)
+    print(json.dumps(report, indent=2))
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete product images no product references")
+    parser.add_argument("--dry-run", action="store_true", help="report orphans without deleting them")
+    parser.add_argument("--grace-hours", type=float, help="override IMAGE_GC_GRACE_SECONDS")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args.dry_run, args.grace_hours)))
@@ -0,0 +1,243 @@
+"""
+Resized and re-encoded variants of product images.
+
+Each uploaded image gets, next to the original object `<id>`:
+
+    <id>_w<width>           resized, in the original's format (JPEG, or PNG if it has alpha)
+    <id>_w<width>.<format>  resized, re-encoded as WebP / AVIF
+    <id>.<format>           full size, re-encoded as WebP / AVIF
+
+Names are derived from the id alone, so serving needs no manifest; a variant
+that has not been generated yet simply falls back to the original. Encoding
+runs in a process pool so the event loop never does image work.
+
+Existing images are backfilled with:
+
+    python -m app.image_variants [--force]
+"""
+import argparse
+import asyncio
+import io
+import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, List, Optional, Set, Tuple
+
+from PIL import Image, ImageOps, features
+
+from app.cache import missing_image_cache
+from app.config import settings
+
+if TYPE_CHECKING:
+    from app.minio import Bucket
+
+logger = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = (200, 600, 1200)
+MODERN_FORMATS = ("avif", "webp") if features.check("avif") else ("webp",)
+VARIANT_CONTENT_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+}
+_ENCODE_OPTIONS = {
+    "avif": {"format": "AVIF", "quality": 60},
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "jpeg": {"format": "JPEG", "quality": 85, "optimize": True, "progressive": True},
+    "png": {"format": "PNG", "optimize": True},
+}
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def variant_name(image_id: str, width: Optional[int] = None, fmt: Optional[str] = None) -> str:
+    name = image_id if width is None else f"{image_id}_w{width}"
+    return name if fmt is None else f"{name}.{fmt}"
+
+
+def variant_names(image_id: str) -> List[str]:
+    """Every name a variant of `image_id` can have"""
+    names = [variant_name(image_id, None, fmt) for fmt in ("avif", "webp")]
+    for width in VARIANT_WIDTHS:
+        names.append(variant_name(image_id, width))
+        names.extend(variant_name(image_id, width, fmt) for fmt in ("avif", "webp"))
+    return names
+
+
+def choose_variant(
+    image_id: str, width: Optional[int], fmt: Optional[str], accept: str
+) -> Tuple[str, bool]:
+    """
+    Object name to serve for a request, and whether the choice depended on
+    the Accept header. `width` is rounded up to the next generated width; an
+    explicit `fmt` wins over negotiation, "original" disables re-encoding.
+    """
+    negotiated = False
+    if fmt is None:
+        negotiated = True
+        fmt = next((f for f in MODERN_FORMATS if VARIANT_CONTENT_TYPES[f] in accept), None)
+    elif fmt == "original":
+        fmt = None
+    bucket_width = None
+    if width is not None:
+        bucket_width = next((w for w in VARIANT_WIDTHS if w >= width), None)
+    return variant_name(image_id, bucket_width, fmt), negotiated
+
+
+def _encode(image: Image.Image, fmt: str) -> bytes:
+    if fmt == "jpeg" and image.mode != "RGB":
+        image = image.convert("RGB")
+    out = io.BytesIO()
+    image.save(out, **_ENCODE_OPTIONS[fmt])
+    return out.getvalue()
+
+
+def render_variants(data: bytes) -> List[Tuple[str, str, bytes]]:
+    """
+    (suffix, content type, bytes) for every variant of an image. Runs in a
+    worker process. Formats Pillow can't read, and animations, get none.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        if getattr(image, "is_animated", False):
+            return []
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except Exception:
+        return []
+
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    fallback = "png" if has_alpha else "jpeg"
+
+    variants = [(f".{fmt}", VARIANT_CONTENT_TYPES[fmt], _encode(image, fmt)) for fmt in MODERN_FORMATS]
+    for width in VARIANT_WIDTHS:
+        resized = image
+        if image.width > width:
+            resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        variants.append((f"_w{width}", VARIANT_CONTENT_TYPES[fallback], _encode(resized, fallback)))
+        for fmt in MODERN_FORMATS:
+            variants.append((f"_w{width}.{fmt}", VARIANT_CONTENT_TYPES[fmt], _encode(resized, fmt)))
+    return variants
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.IMAGE_VARIANT_WORKERS)
+    return _pool
+
+
+def shutdown_pool() -> None:
+    """Stop the variant workers and the process pool; queued images are left to the backfill"""
+    global _pool, _queue
+    for worker in _workers:
+        worker.cancel()
+    _workers.clear()
+    _queued.clear()
+    _queue = None
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def generate_variants(bucket: "Bucket", image_id: str, data: bytes) -> int:
+    """Render the variants of one image in the pool and store them; returns how many"""
+    loop = asyncio.get_running_loop()
+    variants = await loop.run_in_executor(_get_pool(), render_variants, data)
+    await asyncio.gather(*(
+        bucket.put_bytes(f"{image_id}{suffix}", payload, content_type)
+        for suffix, content_type, payload in variants
+    ))
+    for suffix, _, _ in variants:
+        missing_image_cache.delete(f"{image_id}{suffix}")
+    return len(variants)
+
+
+# Images waiting for variants, by name only: a worker reads the original back
+# from the bucket when it gets to one, so a bulk import queues ids, not bytes,
+# and at most IMAGE_VARIANT_WORKERS originals are in memory at a time.
+_queue: Optional[asyncio.Queue] = None
+_queued: Set[str] = set()
+_workers: List[asyncio.Task] = []
+
+
+def schedule_variants(bucket: "Bucket", image_id: str) -> None:
+    """Generate variants after the upload returns; the original is served until then"""
+    global _queue
+    if image_id in _queued:
+        return
+    if _queue is None:
+        _queue = asyncio.Queue()
+        _workers.extend(asyncio.create_task(_worker(_queue)) for _ in range(settings.IMAGE_VARIANT_WORKERS))
+    _queued.add(image_id)
+    _queue.put_nowait((bucket, image_id))
+
+
+async def _worker(queue: asyncio.Queue) -> None:
+    while True:
+        bucket, image_id = await queue.get()
+        try:
+            data, _, _ = await bucket.get(image_id)
+            await generate_variants(bucket, image_id, data)
+        except Exception as e:
+            logger.error(f"Failed to generate variants for {image_id}: {e}")
+        finally:
+            _queued.discard(image_id)
+            queue.task_done()
+
+
+async def backfill(force: bool = False, concurrency: int = 4) -> Tuple[int, int]:
+    """Generate variants for every referenced product image; returns (processed, skipped)"""
+    from app.api.products import image_bucket
+    from app.models.products import Product
+
+    collection = Product.get_pymongo_collection()
+    image_ids = set()
+    async for doc in collection.find({"image_urls.0": {"$exists": True}}, {"image_urls": 1, "_id": 0}):
+        image_ids.update(doc["image_urls"])
+
+    semaphore = asyncio.Semaphore(concurrency)
+    processed = skipped = 0
+
+    async def one(image_id: str):
+        nonlocal processed, skipped
+        async with semaphore:
+            if not force:
+                try:
+                    await image_bucket.stat(variant_name(image_id, VARIANT_WIDTHS[0], "webp"))
+                    skipped += 1
+                    return
+                except Exception:
+                    pass
+            try:
+                data, _, _ = await image_bucket.get(image_id)
+                count = await generate_variants(image_bucket, image_id, data)
+                processed += 1
+                logger.info(f"{image_id}: {count} variants")
+            except Exception as e:
+                logger.error(f"{image_id}: {e}")
+
+    await asyncio.gather(*(one(image_id) for image_id in image_ids))
+    return processed, skipped
+
+
+async def _main(force: bool) -> int:
+    from app.main import init_minio, init_mongo
+
+    await init_mongo(skip_indexes=True)
+    await init_minio()
+    try:
+        processed, skipped = await backfill(force=force)
+    finally:
+        shutdown_pool()
+    logger.info(f"Backfill done: {processed} images processed, {skipped} already had variants")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate resized/WebP/AVIF variants of product images")
+    parser.add_argument("--force", action="store_true", help="regenerate variants that already exist")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args.force)))
@@ -0,0 +1,160 @@
+"""
+Index management for the Beanie documents.
+
+Indexes are declared on each document's ``Settings.indexes``. They are built
+in a background task at startup so the API does not wait on a long build, and
+can also be built or verified from the command line:
+
+    python -m app.indexes           # build the declared indexes
+    python -m app.indexes --check   # explain() every product and order query shape
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import datetime
+from typing import Iterable, List, Type
+
+from beanie import Document
+from bson import ObjectId
+
+from app.models.order import Order, OrderFilters, OrderStatus
+from app.models.products import Product
+from app.services.order_service import ORDER_LISTING_SORT, OrderService
+from app.services.product import ProductService
+from app.utils import encode_cursor
+
+logger = logging.getLogger(__name__)
+
+_SHAPE_CURSOR = encode_cursor(datetime(2024, 1, 1), ObjectId())
+
+# Every filter combination the storefront sends to ProductService.build_filter.
+PRODUCT_QUERY_SHAPES: List[dict] = [
+    {},
+    {"category": "shape-check"},
+    {"category": "shape-check", "min_price": 0, "max_price": 10_000},
+    {"category": "shape-check", "min_price": 0},
+    {"category": "shape-check", "brand": "shape-check"},
+    {"min_price": 0, "max_price": 10_000},
+    {"brand": "shape-check"},
+    {"title": "shape-check"},
+    {"title": "shape-check", "category": "shape-check"},
+    {"title": "shape-check", "title_prefix": True},
+    {"after": _SHAPE_CURSOR},
+    {"after": _SHAPE_CURSOR, "category": "shape-check"},
+]
+
+# Filter combinations the admin order listings send to OrderService.build_admin_filter.
+# Each is checked across every zone (Super_Admin) and within one zone (regular
+# admins, OrderService.zone_filter) for these customers.
+ORDER_QUERY_SHAPES: List[OrderFilters] = [
+    OrderFilters(),
+    OrderFilters(status=OrderStatus.PENDING),
+    OrderFilters(status=OrderStatus.PENDING, guest=True),
+    OrderFilters(wilaya="shape-check"),
+    OrderFilters(wilaya="shape-check", status=OrderStatus.PENDING),
+    OrderFilters(created_from=datetime(2024, 1, 1), created_to=datetime(2024, 2, 1)),
+    OrderFilters(after=_SHAPE_CURSOR),
+    OrderFilters(status=OrderStatus.PENDING, after=_SHAPE_CURSOR),
+]
+_SHAPE_ZONE_CUSTOMERS = [ObjectId() for _ in range(3)]
+
+# Plan stages meaning the query reads the whole collection or sorts in memory.
+FORBIDDEN_STAGES = {"COLLSCAN", "SORT"}
+# Search results are few and sorted once matched (by relevance, or by date
+# for the prefix fallback), so searches only have to avoid a COLLSCAN.
+FORBIDDEN_SEARCH_STAGES = {"COLLSCAN"}
+
+
+async def build_indexes(models: Iterable[Type[Document]]) -> None:
+    """Create the indexes declared in ``Settings.indexes`` for each model"""
+    for model in models:
+        indexes = [field.index for field in model.get_settings().indexes]
+        if not indexes:
+            continue
+        collection = model.get_pymongo_collection()
+        try:
+            names = await collection.create_indexes(indexes)
+            logger.info(f"Indexes ready on {collection.name}: {', '.join(names)}")
+        except Exception as e:
+            logger.error(f"Failed to build indexes on {collection.name}: {e}")
+
+
+def _plan_stages(plan: dict) -> List[str]:
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages.extend(_plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+async def check_product_query_plans(limit: int = 50) -> List[str]:
+    """
+    Run explain() on every product query shape and return a description of
+    each one whose winning plan scans the collection or sorts in memory.
+    """
+    collection = Product.get_pymongo_collection()
+    failures = []
+    for shape in PRODUCT_QUERY_SHAPES:
+        query = ProductService.build_filter(**shape)
+        cursor = collection.find(query).sort(ProductService.sort_for(query)).limit(limit)
+        explain = await cursor.explain()
+        stages = _plan_stages(explain["queryPlanner"]["winningPlan"])
+        forbidden = FORBIDDEN_SEARCH_STAGES if shape.get("title") else FORBIDDEN_STAGES
+        bad = forbidden.intersection(stages)
+        if bad:
+            failures.append(f"{shape}: {' -> '.join(stages)}")
+    return failures
+
+
+async def check_order_query_plans() -> List[str]:
+    """Same as check_product_query_plans, for the admin order listings"""
+    collection = Order.get_pymongo_collection()
+    failures = []
+    for filters in ORDER_QUERY_SHAPES:
+        query = OrderService.build_admin_filter(filters)
+        zone_query = OrderService.zone_filter(query, _SHAPE_ZONE_CUSTOMERS)
+        for scope, shape in (("all zones", query), ("one zone", zone_query)):
+            shape = OrderService.after_cursor(shape, filters.after)
+            cursor = collection.find(shape).sort(ORDER_LISTING_SORT).limit(filters.limit)
+            explain = await cursor.explain()
+            stages = _plan_stages(explain["queryPlanner"]["winningPlan"])
+            bad = FORBIDDEN_STAGES.intersection(stages)
+            if bad:
+                failures.append(f"{filters.model_dump(exclude_defaults=True)} ({scope}): {' -> '.join(stages)}")
+    return failures
+
+
+async def _main(check: bool) -> int:
+    from app.main import DOCUMENT_MODELS, init_mongo
+
+    await init_mongo(skip_indexes=True)
+    await build_indexes(DOCUMENT_MODELS)
+    if not check:
+        return 0
+
+    failures = await check_product_query_plans()
+    for failure in failures:
+        logger.error(f"Unindexed product query: {failure}")
+    order_failures = await check_order_query_plans()
+    for failure in order_failures:
+        logger.error(f"Unindexed order query: {failure}")
+    if failures or order_failures:
+        return 1
+    logger.info(
+        f"All {len(PRODUCT_QUERY_SHAPES)} product and {2 * len(ORDER_QUERY_SHAPES)} order query shapes use an index"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and verify MongoDB indexes")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="fail if a product or order query shape falls back to COLLSCAN or an in-memory SORT",
+    )
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args.check)))
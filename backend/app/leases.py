@@ -0,0 +1,92 @@
+"""
+Leases in MongoDB for work that must run in one process at a time.
+
+Every uvicorn/gunicorn worker runs the same lifespan, so startup migrations
+and periodic jobs take a lease first: a `leases` document naming its holder
+and an expiry. Taking it is a single conditional upsert, which only succeeds
+when the lease is free, expired or already ours; a holder that dies simply
+lets it expire.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from pymongo.errors import DuplicateKeyError
+
+from app.models.lease import Lease
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process among all API workers and hosts
+HOLDER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+T = TypeVar("T")
+
+
+async def acquire(name: str, ttl: timedelta) -> bool:
+    """Take or renew the lease `name` for `ttl`; False if another process holds it"""
+    now = datetime.utcnow()
+    try:
+        await Lease.get_pymongo_collection().update_one(
+            {
+                "_id": name,
+                "done_at": None,
+                "$or": [{"expires_at": {"$lte": now}}, {"holder": HOLDER}],
+            },
+            {"$set": {"holder": HOLDER, "expires_at": now + ttl}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # The document exists and did not match: held elsewhere, or done
+        return False
+    return True
+
+
+async def release(name: str) -> None:
+    await Lease.get_pymongo_collection().update_one(
+        {"_id": name, "holder": HOLDER}, {"$set": {"expires_at": datetime.utcnow()}}
+    )
+
+
+async def _keep_alive(name: str, ttl: timedelta) -> None:
+    while True:
+        await asyncio.sleep(ttl.total_seconds() / 3)
+        await acquire(name, ttl)
+
+
+async def run_once(
+    name: str,
+    job: Callable[[], Awaitable[T]],
+    ttl: timedelta = timedelta(minutes=2),
+    poll_seconds: float = 1.0,
+) -> Optional[T]:
+    """
+    Run `job` once across all processes and deploys. One process runs it
+    while the others wait for it to finish; once it has succeeded, later
+    calls return None after a single lookup. A failed run frees the lease so
+    the next caller retries.
+    """
+    collection = Lease.get_pymongo_collection()
+    while True:
+        lease = await collection.find_one({"_id": name}, {"done_at": 1})
+        if lease is not None and lease.get("done_at") is not None:
+            return None
+        if await acquire(name, ttl):
+            break
+        await asyncio.sleep(poll_seconds)
+
+    keep_alive = asyncio.create_task(_keep_alive(name, ttl))
+    try:
+        result = await job()
+    except BaseException:
+        keep_alive.cancel()
+        await release(name)
+        raise
+    keep_alive.cancel()
+    await collection.update_one({"_id": name, "holder": HOLDER}, {"$set": {"done_at": datetime.utcnow()}})
+    logger.info(f"{name} done")
+    return result
@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from fastapi.staticfiles import StaticFiles
@@ -11,22 +12,47 @@ from beanie import init_beanie
 from app.models.user import User
 from app.api.user import router as user_router
 from app.api.categories import router as categories_router
-from app.api.products import router as products_router
+from app.api.products import router as products_router, image_bucket
 from app.api.order import router as order_router
 from app.api.dashboard import router as dashboard_router
 from app.minio import init_minio_client
+from app.image_cache import init_image_disk_cache
+from app.image_variants import shutdown_pool
+from app.image_gc import run_image_gc
 from app.models.products import Product
 from app.models.category import Category
 from app.models.order import Order
+from app.models.lease import Lease
+from app.leases import run_once
+from app.indexes import build_indexes
+from app.migrate_order_lines import migrate_order_lines
+from app.migrate_product_search import migrate_product_search
+from app.serializers import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from app.upload_limits import UploadLimitMiddleware
 
 
 mongo_client = AsyncMongoClient(settings.MONGO_URI)
 mongo_db = mongo_client[settings.MONGO_DB]
 
 
-async def init_mongo():
-    await init_beanie(database=mongo_db, document_models=[User, Product, Category, Order])
+DOCUMENT_MODELS = [User, Product, Category, Order, Lease]
+
+
+async def init_mongo(skip_indexes: bool = False):
+    await init_beanie(database=mongo_db, document_models=DOCUMENT_MODELS, skip_indexes=skip_indexes)
+
+
+async def init_minio():
+    await init_minio_client(
+        minio_host=settings.MINIO_HOST,
+        minio_port=settings.MINIO_PORT,
+        minio_root_user=settings.MINIO_ROOT_USER,
+        minio_root_password=settings.MINIO_ROOT_PASSWORD,
+        secure=settings.MINIO_SECURE,
+    )
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Log config for debugging
@@ -37,24 +63,47 @@ async def lifespan(app: FastAPI):
     logger.info(f"MONGO_URI: {settings.MONGO_URI[:30]}...")
     logger.info(f"ALLOWED_ORIGINS: {settings.ALLOWED_ORIGINS}")
 
-    await init_mongo()
-    await init_minio_client(
-        minio_host=settings.MINIO_HOST,
-        minio_port=settings.MINIO_PORT,
-        minio_root_user=settings.MINIO_ROOT_USER,
-        minio_root_password=settings.MINIO_ROOT_PASSWORD,
-        secure=settings.MINIO_SECURE,
-    )
+    # Indexes are built in the background so a long build never delays startup
+    await init_mongo(skip_indexes=True)
+    index_task = asyncio.create_task(build_indexes(DOCUMENT_MODELS))
+    # Orders are only read through their line snapshots, so orders from before
+    # them are backfilled before serving. One worker runs it while the others
+    # wait; later startups only read its "done" lease
+    report = await run_once("migrate_order_lines", migrate_order_lines)
+    if report and report["pending"]:
+        logger.info(f"Backfilled line snapshots on {report['migrated']} orders")
+    # Same for the derived keys behind prefix search and the brand filter
+    report = await run_once("migrate_product_search", migrate_product_search)
+    if report and report["pending"]:
+        logger.info(f"Backfilled search keys on {report['migrated']} products")
+    await init_minio()
+    init_image_disk_cache()
+    gc_task = None
+    if settings.IMAGE_GC_INTERVAL_SECONDS > 0:
+        gc_task = asyncio.create_task(run_image_gc(image_bucket))
     yield
+    index_task.cancel()
+    if gc_task is not None:
+        gc_task.cancel()
+    shutdown_pool()
 
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+app.add_middleware(
+    UploadLimitMiddleware,
+    rules=[
+        ("POST", r"/products/?", settings.PRODUCT_FORM_MAX_BYTES),
+        ("PATCH", r"/products/[^/]+", settings.PRODUCT_FORM_MAX_BYTES),
+        ("POST", r"/products/import", settings.PRODUCT_IMPORT_MAX_BYTES),
+    ],
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[*settings.allowed_origins_list], 
     allow_credentials=True,
     allow_methods=["*"], 
     allow_headers=["*"],  
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],
 )
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 app.include_router(user_router)
@@ -0,0 +1,133 @@
+"""
+Backfill `lines` and `total_dzd` on orders created before line snapshots.
+
+Older orders store `item` as [product reference, quantity] pairs and had to
+fetch every product to be read. This migration resolves those references in
+batches (one `$in` per batch), writes the snapshot with one bulk_write per
+batch and leaves `item` in place. Products deleted since keep whatever the
+order had embedded, or become "(deleted product)" at price 0.
+
+Orders that already have `lines` are skipped, so it can be re-run safely.
+The API runs it at startup before serving, since reads no longer fall back
+to `item`: one worker takes the "migrate_order_lines" lease (app.leases) and
+the others wait, and once it has finished later startups skip it. It can
+also be run ahead of a deploy:
+
+    python -m app.migrate_order_lines              # migrate
+    python -m app.migrate_order_lines --dry-run    # only count
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from bson import DBRef, ObjectId
+from pymongo import UpdateOne
+
+from app.models.order import Order, OrderLine
+from app.models.products import Product
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = 500
+DELETED_PRODUCT_TITLE = "(deleted product)"
+
+
+def _legacy_reference(entry) -> Tuple[Optional[ObjectId], dict, int]:
+    """(product id, embedded product fields, quantity) of one legacy `item` pair"""
+    reference, quantity = entry[0], int(entry[1])
+    if isinstance(reference, DBRef):
+        return reference.id, {}, quantity
+    if isinstance(reference, ObjectId):
+        return reference, {}, quantity
+    if isinstance(reference, dict):
+        product_id = reference.get("_id", reference.get("$id"))
+        return product_id, reference, quantity
+    return None, {}, quantity
+
+
+def _snapshot(product_id: Optional[ObjectId], product: Optional[dict], quantity: int) -> OrderLine:
+    product = product or {}
+    price = float(product.get("price_dzd") or 0)
+    image_urls = product.get("image_urls") or []
+    return OrderLine(
+        product_id=product_id or ObjectId("0" * 24),
+        title=product.get("title") or DELETED_PRODUCT_TITLE,
+        category=product.get("category") or "",
+        image_url=image_urls[0] if image_urls else None,
+        unit_price_dzd=price,
+        quantity=quantity,
+        subtotal_dzd=price * quantity,
+    )
+
+
+async def migrate_order_lines(batch_size: int = MIGRATION_BATCH_SIZE, dry_run: bool = False) -> dict:
+    orders = Order.get_pymongo_collection()
+    products = Product.get_pymongo_collection()
+    pending = {"lines": {"$exists": False}}
+    report = {"pending": await orders.count_documents(pending), "migrated": 0, "missing_products": 0}
+    if dry_run:
+        return report
+
+    last_id = None
+    while True:
+        query = dict(pending)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await orders.find(query, {"item": 1}).sort("_id", 1).limit(batch_size).to_list(None)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        parsed = {
+            doc["_id"]: [_legacy_reference(entry) for entry in doc.get("item") or []]
+            for doc in batch
+        }
+        product_ids = {product_id for entries in parsed.values() for product_id, _, _ in entries if product_id}
+        found: Dict[ObjectId, dict] = {
+            doc["_id"]: doc
+            async for doc in products.find(
+                {"_id": {"$in": list(product_ids)}},
+                {"title": 1, "category": 1, "price_dzd": 1, "image_urls": {"$slice": 1}},
+            )
+        }
+
+        operations = []
+        for order_id, entries in parsed.items():
+            lines: List[OrderLine] = []
+            for product_id, embedded, quantity in entries:
+                product = found.get(product_id)
+                if product is None:
+                    report["missing_products"] += 1
+                    product = embedded
+                lines.append(_snapshot(product_id, product, quantity))
+            operations.append(UpdateOne(
+                {"_id": order_id, "lines": {"$exists": False}},
+                {"$set": {
+                    "lines": [line.model_dump() for line in lines],
+                    "total_dzd": sum(line.subtotal_dzd for line in lines),
+                }},
+            ))
+        result = await orders.bulk_write(operations, ordered=False)
+        report["migrated"] += result.modified_count
+        logger.info(f"Migrated {report['migrated']}/{report['pending']} orders")
+    return report
+
+
+async def _main(batch_size: int, dry_run: bool) -> int:
+    from app.main import init_mongo
+
+    await init_mongo(skip_indexes=True)
+    report = await migrate_order_lines(batch_size=batch_size, dry_run=dry_run)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill order line snapshots and totals")
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="count orders to migrate without writing")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args.batch_size, args.dry_run)))
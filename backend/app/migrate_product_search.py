@@ -0,0 +1,77 @@
+"""
+Backfill `title_words` and `brand_key` on products saved before them.
+
+The prefix search fallback and the brand filter only read these derived
+keys, which Product sets whenever it is saved and the importer sets on each
+upsert. This fills them in on older products, in `_id` batches with one
+bulk_write each. Products that already have `title_words` are skipped, so it
+can be re-run safely. The API runs it once at startup, under the
+"migrate_product_search" lease (app.leases); by hand:
+
+    python -m app.migrate_product_search              # migrate
+    python -m app.migrate_product_search --dry-run    # only count
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+
+from pymongo import UpdateOne
+
+from app.models.products import Product
+from app.utils import search_key, search_words
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = 1000
+
+
+async def migrate_product_search(batch_size: int = MIGRATION_BATCH_SIZE, dry_run: bool = False) -> dict:
+    products = Product.get_pymongo_collection()
+    pending = {"title_words": {"$exists": False}}
+    report = {"pending": await products.count_documents(pending), "migrated": 0}
+    if dry_run:
+        return report
+
+    last_id = None
+    while True:
+        query = dict(pending)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await products.find(query, {"title": 1, "brand": 1}).sort("_id", 1).limit(batch_size).to_list(None)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        operations = [
+            UpdateOne(
+                {"_id": doc["_id"], "title_words": {"$exists": False}},
+                {"$set": {
+                    "title_words": search_words(doc.get("title")),
+                    "brand_key": search_key(doc["brand"]) if doc.get("brand") else None,
+                }},
+            )
+            for doc in batch
+        ]
+        result = await products.bulk_write(operations, ordered=False)
+        report["migrated"] += result.modified_count
+        logger.info(f"Migrated {report['migrated']}/{report['pending']} products")
+    return report
+
+
+async def _main(batch_size: int, dry_run: bool) -> int:
+    from app.main import init_mongo
+
+    await init_mongo(skip_indexes=True)
+    report = await migrate_product_search(batch_size=batch_size, dry_run=dry_run)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill product search keys")
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="count products to migrate without writing")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args.batch_size, args.dry_run)))
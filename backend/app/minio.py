@@ -1,17 +1,47 @@
+import asyncio
+import hashlib
+import io
+import logging
 import random
+import re
 import string
+import time
 import uuid
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, BinaryIO
 from fastapi import UploadFile
 from miniopy_async.error import S3Error  # type: ignore
 from miniopy_async.api import Minio  # type: ignore
+from miniopy_async.datatypes import Object  # type: ignore
+from miniopy_async.deleteobjects import DeleteObject  # type: ignore
+from miniopy_async.commonconfig import REPLACE, CopySource  # type: ignore
+from fastapi import HTTPException, status
+from starlette.datastructures import Headers
 
-from app.utils import check_extension
+from app.config import settings
+from app.utils import check_extension, sniff_image_extension, sniffed_type_matches
+from app.image_variants import schedule_variants, variant_names
 from app import exceptions
 
+logger = logging.getLogger(__name__)
+
 IMAGES_BUCKET_NAME = "images"
 DOCUMENTS_BUCKET_NAME = "documents"
 WA_SIM_BUCKET_NAME = "wa-sim"
 
+HASH_CHUNK_SIZE = 1024 * 1024
+# Uploads stream here while they are hashed, then move to their digest name;
+# leftovers from a crash are unreferenced and swept by the image GC
+UPLOAD_TEMP_PREFIX = "tmp-"
+# Leading bytes inspected to tell the real type of an upload
+SNIFF_BYTES = 4096
+
+# Chunk size relayed from MinIO to the client; aiohttp's reader pauses the
+# socket once its buffer fills, so this bounds per-request memory.
+STREAM_CHUNK_SIZE = 64 * 1024
+_SINGLE_RANGE = re.compile(r"^bytes=(\d+-\d*|-\d+)$")
+
 async def init_minio_client(
     minio_host: str, minio_port: int, minio_root_user: str, minio_root_password: str, secure: bool = False
 ):
@@ -32,10 +62,19 @@ async def init_minio_client(
         if not await Bucket.client.bucket_exists(bucket_name):
             await Bucket.client.make_bucket(bucket_name)
 
+class PartialUploadError(Exception):
+    def __init__(self, uploaded: list[str], cause: BaseException):
+        super().__init__(str(cause))
+        self.uploaded = uploaded
+        self.cause = cause
+
+
 class Bucket:
     bucket_name: str
     file_prefix: str
     client: Minio
+    # Largest object put() accepts; None means unlimited
+    max_upload_bytes: int | None = None
 
     def __init__(self, bucket_name: str, file_prefix: str):
         self.bucket_name = bucket_name
@@ -51,10 +90,15 @@ class Bucket:
         if file.filename is None:
             file.filename = object_name
 
+        self.check_size(file)
+        await self._upload(file, object_name, file.file)
+        return object_name
+
+    async def _upload(self, file: UploadFile, object_name: str, data: BinaryIO) -> None:
         await self.client.put_object(
             bucket_name=self.bucket_name,
             object_name=f"{self.file_prefix}/{object_name}",
-            data=file.file,
+            data=data,
             length=-1,
             part_size=10 * 1024 * 1024,
             content_type=file.content_type,
@@ -62,6 +106,69 @@ class Bucket:
                 "filename": file.filename,
             },
         )
+
+    async def put_new(self, file: UploadFile) -> tuple[str, bool]:
+        """put() under a generated name, and whether that wrote a new object"""
+        return await self.put(file), True
+
+    def check_size(self, file: UploadFile) -> None:
+        """Reject an upload above max_upload_bytes before it is sent to MinIO"""
+        if self.max_upload_bytes is None:
+            return
+        size = file.size
+        if size is None:
+            position = file.file.tell()
+            size = file.file.seek(0, io.SEEK_END)
+            file.file.seek(position)
+        if size > self.max_upload_bytes:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"{file.filename} is larger than {self.max_upload_bytes} bytes",
+            )
+
+    async def put_many(self, files: list[UploadFile], concurrency: int) -> list[tuple[str, bool]]:
+        """
+        Upload files concurrently, at most `concurrency` at a time, and return
+        (object name, newly written) pairs in order. If any upload fails,
+        PartialUploadError names the objects that were newly written so the
+        caller can roll them back.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        durations = [0.0] * len(files)
+
+        async def upload(index: int, file: UploadFile) -> tuple[str, bool]:
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    return await self.put_new(file)
+                finally:
+                    durations[index] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(upload(index, file) for index, file in enumerate(files)), return_exceptions=True
+        )
+        logger.info(
+            f"Uploaded {len(files)} objects to {self.bucket_name} in "
+            f"{(time.perf_counter() - started) * 1000:.0f} ms with concurrency {concurrency} "
+            f"(per object: {', '.join(f'{d * 1000:.0f}' for d in durations)} ms)"
+        )
+
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            raise PartialUploadError(
+                [r[0] for r in results if isinstance(r, tuple) and r[1]], errors[0]
+            )
+        return results
+
+    async def put_bytes(self, object_name: str, data: bytes, content_type: str) -> str:
+        await self.client.put_object(
+            bucket_name=self.bucket_name,
+            object_name=f"{self.file_prefix}/{object_name}",
+            data=io.BytesIO(data),
+            length=len(data),
+            content_type=content_type,
+        )
         return object_name
 
     async def get(self, object_name: str) -> tuple[bytes, str, str]:
@@ -85,12 +192,172 @@ class Bucket:
         res.close()
         return (data, filename, content_type)
 
+    async def open(self, object_name: str, byte_range: str | None = None) -> "ObjectStream":
+        """
+        Start a GET and return the open response without reading its body.
+        A single `bytes=` range is forwarded to MinIO; anything else (multiple
+        ranges, other units) is ignored and the full object is served, which
+        RFC 9110 allows.
+        """
+        request_headers = None
+        if byte_range is not None and _SINGLE_RANGE.match(byte_range.strip()):
+            request_headers = {"Range": byte_range.strip()}
+        try:
+            res = await self.client.get_object(
+                bucket_name=self.bucket_name,
+                object_name=f"{self.file_prefix}/{object_name}",
+                request_headers=request_headers,
+            )
+        except S3Error as e:
+            if e.code == "NoSuchKey":
+                raise exceptions.NotFound
+            if e.code == "InvalidRange":
+                raise exceptions.RangeNotSatisfiable
+            raise e
+        return ObjectStream(res, object_name)
+
+    async def info(self, object_name: str) -> Object:
+        """Object metadata (size, content type, etag...) from a HEAD request"""
+        try:
+            return await self.client.stat_object(
+                bucket_name=self.bucket_name,
+                object_name=f"{self.file_prefix}/{object_name}",
+            )
+        except S3Error as e:
+            if e.code == "NoSuchKey":
+                raise exceptions.NotFound
+            raise e
+
+    async def stat(self, object_name: str) -> tuple[str, datetime | None]:
+        """(quoted etag, last modified) of an object"""
+        info = await self.info(object_name)
+        return f'"{info.etag}"', info.last_modified
+
+    async def read_head(self, object_name: str, length: int) -> bytes:
+        """First `length` bytes of an object"""
+        try:
+            res = await self.client.get_object(
+                bucket_name=self.bucket_name,
+                object_name=f"{self.file_prefix}/{object_name}",
+                offset=0,
+                length=length,
+            )
+        except S3Error as e:
+            if e.code == "NoSuchKey":
+                raise exceptions.NotFound
+            raise e
+        try:
+            return await res.read()
+        finally:
+            res.release()
+
+    async def presigned_get(self, object_name: str, expires: timedelta) -> str:
+        """Short-lived URL the client can GET the object from directly"""
+        return await self.client.presigned_get_object(
+            bucket_name=self.bucket_name,
+            object_name=f"{self.file_prefix}/{object_name}",
+            expires=expires,
+        )
+
+    async def presigned_put(self, object_name: str, expires: timedelta) -> str:
+        """URL the client can PUT the object's bytes to directly"""
+        return await self.client.presigned_put_object(
+            bucket_name=self.bucket_name,
+            object_name=f"{self.file_prefix}/{object_name}",
+            expires=expires,
+        )
+
     async def delete(self, object_name: str) -> None:
         await self.client.remove_object(
             bucket_name=self.bucket_name,
             object_name=f"{self.file_prefix}/{object_name}",
         )
 
+    async def exists(self, object_name: str) -> bool:
+        try:
+            await self.info(object_name)
+            return True
+        except exceptions.NotFound:
+            return False
+
+    async def copy(self, source_name: str, object_name: str) -> None:
+        await self.client.copy_object(
+            self.bucket_name,
+            f"{self.file_prefix}/{object_name}",
+            CopySource(self.bucket_name, f"{self.file_prefix}/{source_name}"),
+        )
+
+    async def touch(self, object_name: str) -> None:
+        """Refresh an object's last-modified time with a server-side self-copy"""
+        info = await self.info(object_name)
+        metadata = {"Content-Type": info.content_type or "application/octet-stream"}
+        filename = info.metadata.get("x-amz-meta-filename") if info.metadata else None
+        if filename:
+            metadata["filename"] = filename
+        await self.client.copy_object(
+            self.bucket_name,
+            f"{self.file_prefix}/{object_name}",
+            CopySource(self.bucket_name, f"{self.file_prefix}/{object_name}"),
+            metadata=metadata,
+            metadata_directive=REPLACE,
+        )
+
+    async def iter_objects(self) -> AsyncIterator[tuple[str, datetime | None, int]]:
+        """(name, last modified, size) of every object under the prefix, listed page by page"""
+        prefix = f"{self.file_prefix}/"
+        async for obj in self.client.list_objects(self.bucket_name, prefix=prefix, recursive=True):
+            yield obj.object_name[len(prefix):], obj.last_modified, obj.size
+
+    async def remove_batch(self, object_names: list[str]) -> list[str]:
+        """Delete objects with a multi-object DELETE; returns one message per failure"""
+        errors = []
+        async for error in self.client.remove_objects(
+            self.bucket_name,
+            [DeleteObject(f"{self.file_prefix}/{name}") for name in object_names],
+        ):
+            errors.append(f"{error.name}: {error.code} {error.message}")
+        return errors
+
+
+class ObjectStream:
+    """Open MinIO response relayed to the client chunk by chunk"""
+
+    def __init__(self, response, object_name: str):
+        self.response = response
+        self.status_code: int = response.status
+        self.content_type: str = response.content_type or "application/octet-stream"
+        self.filename: str = response.headers.get("x-amz-meta-filename", object_name)
+        self.content_length: str | None = response.headers.get("Content-Length")
+        self.content_range: str | None = response.headers.get("Content-Range")
+        self.etag: str | None = response.headers.get("ETag")
+        self.last_modified: datetime | None = None
+        if "Last-Modified" in response.headers:
+            try:
+                self.last_modified = parsedate_to_datetime(response.headers["Last-Modified"])
+            except (TypeError, ValueError):
+                pass
+
+    def headers(self) -> dict:
+        headers = {
+            "Accept-Ranges": "bytes",
+            "Content-Disposition": f"inline; filename={self.filename}",
+        }
+        if self.content_length is not None:
+            headers["Content-Length"] = self.content_length
+        if self.content_range is not None:
+            headers["Content-Range"] = self.content_range
+        return headers
+
+    async def iter_chunks(self) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in self.response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            # Returns the connection to the pool, or drops it if the client
+            # went away before the body was fully read
+            self.response.release()
+
+
 image_ext_content_type_map = {
     "apng": ["image/apng"],
     "avif": ["image/avif"],
@@ -103,19 +370,170 @@ image_ext_content_type_map = {
     "ico": ["image/x-icon", "image/vnd.microsoft.icon"],
 }
 
+class _HashingReader:
+    """
+    Wraps an upload's file and hashes its bytes as MinIO reads them. The
+    client seeks around (it probes for the part size), so only reads that
+    extend the hashed prefix are hashed; hexdigest() reads whatever was
+    skipped, which for a single-part upload is nothing.
+    """
+
+    def __init__(self, file: BinaryIO):
+        self._file = file
+        self._digest = hashlib.sha256()
+        self._hashed = 0
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def read(self, size: int = -1) -> bytes:
+        start = self._file.tell()
+        data = self._file.read(size)
+        if start <= self._hashed < start + len(data):
+            self._digest.update(data[self._hashed - start:])
+            self._hashed = start + len(data)
+        return data
+
+    def hexdigest(self) -> str:
+        self._file.seek(self._hashed)
+        while chunk := self._file.read(HASH_CHUNK_SIZE):
+            self._digest.update(chunk)
+            self._hashed += len(chunk)
+        return self._digest.hexdigest()
+
+
 class ImageBucket(Bucket):
+    """
+    Product images are content-addressed: an upload is stored under the
+    SHA-256 of its bytes, so identical photos are stored once however many
+    products use them. Which products use an image is tracked by the
+    products themselves (see ProductImageService).
+    """
+
+    max_upload_bytes = settings.IMAGE_UPLOAD_MAX_BYTES
+
     def __init__(self, file_prefix: str):
         super().__init__(IMAGES_BUCKET_NAME, file_prefix)
 
     async def put(self, file: UploadFile, object_name: str | None = None) -> str:
+        if object_name is None:
+            return (await self.put_new(file))[0]
+        await self._check_image(file)
+        object_name = await super().put(file, object_name)
+        schedule_variants(self, object_name)
+        return object_name
+
+    async def put_new(self, file: UploadFile) -> tuple[str, bool]:
+        """
+        Store an upload under the SHA-256 of its bytes, hashed as they stream
+        to a temporary object which is then copied to the digest name. Returns
+        the name and whether it was newly written: when the digest already
+        existed nothing new was stored, and the caller must not roll it back
+        since another product may be about to use it.
+        """
+        await self._check_image(file)
+        temp_name = f"{UPLOAD_TEMP_PREFIX}{uuid.uuid4()}"
+        reader = _HashingReader(file.file)
+        await self._upload(file, temp_name, reader)
+        try:
+            object_name = reader.hexdigest()
+            if await self.exists(object_name):
+                # Already stored: keep it clear of the orphan sweeper's grace period
+                await self.touch(object_name)
+                return object_name, False
+            await self.copy(temp_name, object_name)
+        finally:
+            await self.delete(temp_name)
+        # Thumbnails and WebP/AVIF copies are stored next to the original
+        schedule_variants(self, object_name)
+        return object_name, True
+
+    async def _check_image(self, file: UploadFile) -> None:
+        """Extension, size, and that the first bytes really are the declared image type"""
         check_extension(file, image_ext_content_type_map)
-        return await super().put(file, object_name)
+        self.check_size(file)
+        head = await file.read(SNIFF_BYTES)
+        await file.seek(0)
+        if not head:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{file.filename} is empty")
+        # The bytes decide what the file is, not its name or the client's
+        # content type
+        if not sniffed_type_matches(sniff_image_extension(head), file.content_type, image_ext_content_type_map):
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=f"{file.filename} is not a valid {file.content_type} image",
+            )
+
+    async def delete_image(self, object_name: str) -> list[str]:
+        """Delete an image together with its variants"""
+        return await self.remove_batch([object_name, *variant_names(object_name)])
+
+    async def presign_upload(self, filename: str, content_type: str) -> tuple[str, str]:
+        """
+        Reserve a temporary upload name and return it with a presigned PUT
+        URL. The declared filename and content type are checked here, the
+        bytes themselves by confirm_upload() once the client has sent them.
+        """
+        check_extension(
+            UploadFile(file=io.BytesIO(), filename=filename, headers=Headers({"content-type": content_type})),
+            image_ext_content_type_map,
+        )
+        object_name = str(uuid.uuid4())
+        url = await self.presigned_put(
+            object_name, timedelta(seconds=settings.PRESIGNED_UPLOAD_EXPIRES_SECONDS)
+        )
+        return object_name, url
+
+    async def confirm_upload(self, object_name: str) -> tuple[str, bool]:
+        """
+        Check a directly uploaded object (size, declared content type and the
+        type its first bytes actually have). Rejected objects are deleted;
+        accepted ones are moved to their content address. Returns that name
+        and whether it was newly written, as put_new() does.
+        """
+        try:
+            uuid.UUID(object_name)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid image id: {object_name}")
+        info = await self.info(object_name)
+
+        problem = None
+        if info.size > settings.IMAGE_UPLOAD_MAX_BYTES:
+            problem = f"larger than {settings.IMAGE_UPLOAD_MAX_BYTES} bytes"
+        else:
+            head = await self.read_head(object_name, SNIFF_BYTES)
+            if not sniffed_type_matches(sniff_image_extension(head), info.content_type, image_ext_content_type_map):
+                problem = f"content does not match its content type {info.content_type}"
+        if problem is not None:
+            await self.delete(object_name)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Image {object_name} rejected: {problem}")
+
+        stream = await self.open(object_name)
+        digest = hashlib.sha256()
+        async for chunk in stream.iter_chunks():
+            digest.update(chunk)
+        content_name = digest.hexdigest()
+        created = not await self.exists(content_name)
+        if created:
+            await self.copy(object_name, content_name)
+            schedule_variants(self, content_name)
+        else:
+            await self.touch(content_name)
+        await self.delete(object_name)
+        return content_name, created
 
 class DocumentBucket(Bucket):
+    max_upload_bytes = settings.DOCUMENT_UPLOAD_MAX_BYTES
+
     def __init__(self, file_prefix: str):
         super().__init__(DOCUMENTS_BUCKET_NAME, file_prefix)
 
 class WaSimBucket(Bucket):
+    max_upload_bytes = settings.DOCUMENT_UPLOAD_MAX_BYTES
+
     def __init__(self):
         super().__init__(WA_SIM_BUCKET_NAME, "")
 
@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import Optional
-from beanie import Document
+from beanie import Document, Insert, Replace, Save, SaveChanges, before_event
 from pydantic import BaseModel, Field
 
 
@@ -8,6 +8,11 @@ class Category(Document):
     title: str
     description: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: Optional[datetime] = None
+
+    @before_event(Insert, Replace, Save, SaveChanges)
+    def touch_updated_at(self):
+        self.updated_at = datetime.utcnow()
 
     class Settings:
         name = "categories"
@@ -0,0 +1,17 @@
+from datetime import datetime
+from typing import Optional
+from beanie import Document
+
+
+class Lease(Document):
+    """
+    A named lock shared by every API process (see app.leases). `done_at` is
+    set once a run-once job has finished; its lease is then never handed out.
+    """
+    id: str
+    holder: str
+    expires_at: datetime
+    done_at: Optional[datetime] = None
+
+    class Settings:
+        name = "leases"
@@ -1,9 +1,10 @@
 from datetime import datetime
 from enum import Enum
 from typing import List, Optional
-from beanie import Document, Link
+from beanie import Document, Link, PydanticObjectId
 from bson import ObjectId
 from pydantic import BaseModel, ConfigDict, Field
+from pymongo import ASCENDING, DESCENDING, IndexModel
 from app.models.user import User
 from app.models.products import Product
 
@@ -21,6 +22,32 @@ class DeliveryType(str, Enum):
     PICKUP = "pickup"
     DELIVERY = "delivery"
 
+class OrderLine(BaseModel):
+    """
+    What was bought, frozen at order time: later edits to the product never
+    change an order's lines or amounts, and reading them needs no fetch.
+    """
+    product_id: PydanticObjectId
+    title: str
+    category: str
+    image_url: Optional[str] = None
+    unit_price_dzd: float
+    quantity: int
+    subtotal_dzd: float
+
+    @classmethod
+    def from_product(cls, product: Product, quantity: int) -> "OrderLine":
+        return cls(
+            product_id=product.id,
+            title=product.title,
+            category=product.category,
+            image_url=product.image_urls[0] if product.image_urls else None,
+            unit_price_dzd=product.price_dzd,
+            quantity=quantity,
+            subtotal_dzd=product.price_dzd * quantity,
+        )
+
+
 class Order(Document):
     # For authenticated users (optional now)
     student: Optional[Link[User]] = None
@@ -30,7 +57,8 @@ class Order(Document):
     guest_phone: Optional[str] = None
     is_guest_order: bool = False
 
-    item: List[tuple[Link[Product], int]]
+    lines: List[OrderLine] = []
+    total_dzd: float = 0
     status: OrderStatus = OrderStatus.PENDING
     created_at: datetime = Field(default_factory=datetime.utcnow)
     assigned_admin: Optional[Link[User]] = None
@@ -39,9 +67,61 @@ class Order(Document):
     delivery_phone: Optional[str] = None
     zr_tracking_id: Optional[str] = None
     wilaya: Optional[str] = None
+    # True while the lines' quantities are held out of Product.stock_quantity
+    stock_reserved: bool = False
 
     class Settings:
         name = "orders"
+        # Every order listing is newest first with _id as tie-breaker, so
+        # each filter that narrows a listing leads a (field, created_at, _id)
+        # index; delivery type is a residual predicate. A regular admin's
+        # zone filter is an $or of guest orders and the zone's customers,
+        # each branch served by its own index and merged in sort order.
+        indexes = [
+            IndexModel(
+                [("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="created_at_id_desc",
+            ),
+            IndexModel(
+                [("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="status_created_at_id",
+            ),
+            IndexModel(
+                [("student.$id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="student_created_at_id",
+            ),
+            IndexModel(
+                [("assigned_admin.$id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="assigned_admin_created_at_id",
+            ),
+            IndexModel(
+                [("wilaya", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="wilaya_created_at_id",
+            ),
+            IndexModel(
+                [("is_guest_order", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="is_guest_order_created_at_id",
+            ),
+            # Order history keeps showing line images, so they count as image
+            # references (ProductImageService, image_gc)
+            IndexModel([("lines.image_url", ASCENDING)], name="lines_image_url"),
+        ]
+
+
+class OrderPage(BaseModel):
+    """Keyset pagination parameters shared by every order listing"""
+    after: Optional[str] = Field(None, description="Cursor from the X-Next-Cursor header of the previous page")
+    limit: int = Field(50, ge=1, le=200)
+
+
+class OrderFilters(OrderPage):
+    """Query parameters shared by the admin order listings"""
+    status: Optional[OrderStatus] = None
+    wilaya: Optional[str] = None
+    delivery_type: Optional[DeliveryType] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+    guest: Optional[bool] = Field(None, description="true for guest orders only, false for registered customers only")
 
 
 class OrderItemCreate(BaseModel):
@@ -70,6 +150,8 @@ class orderResponse(BaseModel):
     id: str = Field(alias="_id")
     status: OrderStatus
     item: List[tuple[dict, int]]
+    lines: List[OrderLine] = []
+    total_dzd: float = 0
     delivery_type: DeliveryType
     delivery_address: Optional[str] = None
     zr_tracking_id: Optional[str] = None
@@ -83,74 +165,3 @@ class orderResponse(BaseModel):
         "populate_by_name": True,
         "from_attributes": True
     }
-
-
-def serialize_order(order: Order):
-    return {
-        "id": str(order.id),
-        "status": order.status,
-        "delivery_type": order.delivery_type,
-        "delivery_address": order.delivery_address,
-        "delivery_phone": order.delivery_phone,
-        "zr_tracking_id": order.zr_tracking_id,
-        "created_at": order.created_at,
-        "is_guest_order": order.is_guest_order,
-        "guest_name": order.guest_name,
-        "guest_phone": order.guest_phone,
-        "guest_email": order.guest_email,
-        "wilaya": order.wilaya,
-        "item": [
-            (
-                {
-                    "id": str(product.id),
-                    "title": product.title,
-                    "description": product.description,
-                    "image_urls": product.image_urls,
-                    "category": product.category,
-                    "price_dzd": product.price_dzd,
-                },
-                qty,
-            )
-            for product, qty in order.item
-        ],
-    }
-
-
-def serialize_order_F(order: Order, user: User = None):
-    # Handle both guest orders and authenticated user orders
-    if order.is_guest_order:
-        client_info = {
-            "full_name": order.guest_name,
-            "email": order.guest_email,
-            "phone": order.guest_phone,
-        }
-    else:
-        client_info = {
-            "full_name": user.full_name if user else None,
-            "email": user.email if user else None,
-            "phone": user.phone_number if user else None,
-        }
-
-    return {
-        "_id": str(order.id),
-        "client": client_info,
-        "is_guest_order": order.is_guest_order,
-        "item": [
-            (
-                {
-                    "title": product.title,
-                    "category": product.category,
-                    "price_dzd": product.price_dzd,
-                },
-                int(qty),
-            )
-            for product, qty in order.item
-        ],
-        "status": order.status.value,
-        "delivery_type": order.delivery_type.value,
-        "delivery_address": order.delivery_address,
-        "delivery_phone": order.delivery_phone or (order.guest_phone if order.is_guest_order else None),
-        "wilaya": order.wilaya,
-        "zr_tracking_id": order.zr_tracking_id,
-        "created_at": order.created_at.isoformat(),
-    }
@@ -1,11 +1,14 @@
 from typing import List, Optional
 import datetime
-from beanie import Document, PydanticObjectId
-from pydantic import BaseModel, Field
+from beanie import Document, Insert, PydanticObjectId, Replace, Save, SaveChanges, before_event
+from pydantic import BaseModel, Field, field_validator
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from app.utils import search_key, search_words
 
 
 class Product(Document):
     title: str
+    sku: Optional[str] = None
     description: Optional[str] = None
     image_urls: List[str] = []
     category: str     
@@ -15,15 +18,73 @@ class Product(Document):
     sizes: Optional[List[str]] = []
     colors: Optional[List[str]] = []
     weight: Optional[float] = None
-    created_at: datetime.datetime = Field(default_factory=lambda: datetime.datetime.now())
-     
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    updated_at: Optional[datetime.datetime] = None
+    # Derived search keys (app.utils.search_key): the words of the title for
+    # prefix search, and the brand for the brand filter
+    title_words: List[str] = []
+    brand_key: Optional[str] = None
+
+    @before_event(Insert, Replace, Save, SaveChanges)
+    def touch_updated_at(self):
+        self.updated_at = datetime.datetime.utcnow()
+
+    @before_event(Insert, Replace, Save, SaveChanges)
+    def refresh_search_keys(self):
+        self.title_words = search_words(self.title)
+        self.brand_key = search_key(self.brand) if self.brand else None
     
     class Settings:
         name = "products"
+        # Shapes produced by ProductService.build_filter, sorted newest first
+        # with _id as tie-breaker: the first index serves unfiltered listings
+        # and keyset cursors (price filters are residual predicates), the
+        # next ones follow equality-sort-range for category and brand listings.
+        indexes = [
+            IndexModel(
+                [("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="created_at_id_desc",
+            ),
+            IndexModel(
+                [
+                    ("category", ASCENDING),
+                    ("created_at", DESCENDING),
+                    ("_id", DESCENDING),
+                    ("price_dzd", ASCENDING),
+                ],
+                name="category_created_at_id_price",
+            ),
+            IndexModel(
+                [("brand_key", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="brand_key_created_at_id",
+            ),
+            # Ranked search over title/brand/description. Text index v3 folds
+            # case and diacritics ("Protéine" matches "proteine"); language
+            # "none" keeps French and transliterated Arabic words unstemmed.
+            IndexModel(
+                [("title", TEXT), ("brand", TEXT), ("description", TEXT)],
+                weights={"title": 10, "brand": 5, "description": 1},
+                default_language="none",
+                name="product_text_search",
+            ),
+            # Upsert keys of the bulk importer
+            IndexModel(
+                [("sku", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"sku": {"$type": "string"}},
+                name="sku_unique",
+            ),
+            IndexModel([("title", ASCENDING)], name="title"),
+            # Anchored prefix regexes of the search fallback
+            IndexModel([("title_words", ASCENDING)], name="title_words"),
+            # Image reference counts (ProductImageService)
+            IndexModel([("image_urls", ASCENDING)], name="image_urls"),
+        ]
 
 
 class ProductCreate(BaseModel):
     title: str
+    sku: Optional[str] = None
     description: Optional[str] = None
     category: str
     price_dzd: float
@@ -36,6 +97,7 @@ class ProductCreate(BaseModel):
 
 class ProductUpdate(BaseModel):
     title: Optional[str] = None
+    sku: Optional[str] = None
     description: Optional[str] = None
     category: Optional[str] = None
     price_dzd: Optional[float] = None
@@ -44,4 +106,39 @@ class ProductUpdate(BaseModel):
     sizes: Optional[List[str]] = None
     colors: Optional[List[str]] = None
     weight: Optional[float] = None
-    
\ No newline at end of file
+    
+
+class ProductBatchRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=500)
+
+
+class ImageUploadFile(BaseModel):
+    filename: str
+    content_type: str
+
+
+class ImageUploadRequest(BaseModel):
+    files: List[ImageUploadFile] = Field(..., min_length=1, max_length=20)
+
+
+class ImageUploadConfirm(BaseModel):
+    image_ids: List[str] = Field(..., min_length=1, max_length=20)
+
+
+class ProductImportRow(ProductCreate):
+    """One CSV/NDJSON row of a bulk import. CSV cells arrive as strings."""
+    image_urls: List[str] = []
+
+    @field_validator("sizes", "colors", mode="before")
+    @classmethod
+    def split_comma_list(cls, value):
+        if isinstance(value, str):
+            return [v.strip() for v in value.split(",") if v.strip()]
+        return value
+
+    @field_validator("image_urls", mode="before")
+    @classmethod
+    def split_image_urls(cls, value):
+        if isinstance(value, str):
+            return [v.strip() for v in value.replace("|", " ").split() if v.strip()]
+        return value or []
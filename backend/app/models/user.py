@@ -1,6 +1,7 @@
 from enum import Enum
 from beanie import Document
 from pydantic import BaseModel, Field, EmailStr, field_validator
+from pymongo import ASCENDING, IndexModel
 from datetime import datetime
 from typing import Optional, List
 
@@ -18,8 +19,17 @@ class User(Document):
     full_name: Optional[str]
     phone_number: Optional[str]
     roles: List[Role] = Field(default_factory=lambda: [Role.USER])  
+    # Zone an admin is responsible for, or a customer belongs to
+    era: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+    class Settings:
+        # Zone admins' order listings look up the customers of their zone;
+        # _id in the key lets that read be answered from the index alone
+        indexes = [
+            IndexModel([("era", ASCENDING), ("_id", ASCENDING)], name="era_id"),
+        ]
+
 
 class UserCreate(BaseModel):
     email : str
@@ -0,0 +1,52 @@
+"""
+`fields=` support for list endpoints.
+
+A comma-separated field list is validated against a per-endpoint whitelist and
+turned into a Beanie projection model, so Mongo only sends those fields and
+Pydantic only validates them.
+"""
+from functools import lru_cache
+from typing import Iterable, Optional, Type
+
+from beanie import Document, PydanticObjectId
+from fastapi import HTTPException
+from pydantic import BaseModel, ConfigDict, Field, create_model
+
+
+def parse_fields(
+    fields: Optional[str], allowed: Iterable[str], always: Iterable[str] = ()
+) -> Optional[tuple]:
+    """
+    Split and validate a `fields=` parameter. Returns None when no projection
+    was asked for, otherwise a sorted tuple usable as a cache key.
+    """
+    if fields is None or not fields.strip():
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    requested.discard("id")
+    unknown = requested - set(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(sorted(allowed))}",
+        )
+    return tuple(sorted(requested | set(always)))
+
+
+@lru_cache(maxsize=256)
+def projection_model(document: Type[Document], fields: tuple) -> Type[BaseModel]:
+    """Pydantic model holding `_id` plus `fields` of `document`, built once per field set"""
+    document_fields = document.model_fields
+    definitions = {
+        name: (Optional[document_fields[name].annotation], None) for name in fields
+    }
+    return create_model(
+        f"{document.__name__}Projection",
+        __config__=ConfigDict(populate_by_name=True),
+        id=(PydanticObjectId, Field(alias="_id")),
+        **definitions,
+    )
+
+
+def projected_dict(item: BaseModel, fields: tuple) -> dict:
+    return {"id": str(item.id), **{name: getattr(item, name) for name in fields}}
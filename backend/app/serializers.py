@@ -0,0 +1,141 @@
+"""
+Response serialization.
+
+Every catalog and order payload is built here, and rendered with orjson, which
+handles datetime, enums and tuples natively; ObjectIds are the only extra type.
+Hot routes return `ORJSONResponse` directly to skip FastAPI's response_model
+validation and `jsonable_encoder` pass; it is also the app's default response
+class, so everything else at least gets the faster encoder.
+"""
+from typing import Any
+
+import orjson
+from bson import ObjectId
+from fastapi.responses import ORJSONResponse as _ORJSONResponse
+from pydantic import BaseModel
+
+from app.models.category import Category
+from app.models.order import Order
+from app.models.products import Product
+from app.models.user import User
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONResponse(_ORJSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def serialize_product(product: Product) -> dict:
+    return {
+        "id": str(product.id),
+        "title": product.title,
+        "sku": product.sku,
+        "description": product.description,
+        "image_urls": product.image_urls,
+        "category": product.category,
+        "price_dzd": product.price_dzd,
+        "stock_quantity": product.stock_quantity,
+        "brand": product.brand,
+        "sizes": product.sizes,
+        "colors": product.colors,
+        "weight": product.weight,
+        "created_at": product.created_at,
+        "updated_at": product.updated_at,
+    }
+
+
+def serialize_category(category: Category) -> dict:
+    return {
+        "id": str(category.id),
+        "title": category.title,
+        "description": category.description,
+        "created_at": category.created_at,
+        "updated_at": category.updated_at,
+    }
+
+
+def serialize_order(order: Order):
+    return {
+        "id": str(order.id),
+        "status": order.status,
+        "delivery_type": order.delivery_type,
+        "delivery_address": order.delivery_address,
+        "delivery_phone": order.delivery_phone,
+        "zr_tracking_id": order.zr_tracking_id,
+        "created_at": order.created_at,
+        "is_guest_order": order.is_guest_order,
+        "guest_name": order.guest_name,
+        "guest_phone": order.guest_phone,
+        "guest_email": order.guest_email,
+        "wilaya": order.wilaya,
+        # Legacy (product, quantity) pairs, now built from the line snapshots
+        "item": [
+            (
+                {
+                    "id": str(line.product_id),
+                    "title": line.title,
+                    "description": None,
+                    "image_urls": [line.image_url] if line.image_url else [],
+                    "category": line.category,
+                    "price_dzd": line.unit_price_dzd,
+                },
+                line.quantity,
+            )
+            for line in order.lines
+        ],
+        "lines": order.lines,
+        "total_dzd": order.total_dzd,
+    }
+
+
+def serialize_order_F(order: Order, user: User = None):
+    # Handle both guest orders and authenticated user orders
+    if order.is_guest_order:
+        client_info = {
+            "full_name": order.guest_name,
+            "email": order.guest_email,
+            "phone": order.guest_phone,
+        }
+    else:
+        client_info = {
+            "full_name": user.full_name if user else None,
+            "email": user.email if user else None,
+            "phone": user.phone_number if user else None,
+        }
+
+    return {
+        "_id": str(order.id),
+        "client": client_info,
+        "is_guest_order": order.is_guest_order,
+        "item": [
+            (
+                {
+                    "title": line.title,
+                    "category": line.category,
+                    "price_dzd": line.unit_price_dzd,
+                },
+                line.quantity,
+            )
+            for line in order.lines
+        ],
+        "total_dzd": order.total_dzd,
+        "status": order.status.value,
+        "delivery_type": order.delivery_type.value,
+        "delivery_address": order.delivery_address,
+        "delivery_phone": order.delivery_phone or (order.guest_phone if order.is_guest_order else None),
+        "wilaya": order.wilaya,
+        "zr_tracking_id": order.zr_tracking_id,
+        "created_at": order.created_at.isoformat(),
+    }
@@ -1,4 +1,5 @@
 from app.models.category import Category, CategoryCreate, CategoryUpdate
+from app.cache import category_cache
 from typing import List, Optional
 
 
@@ -12,6 +13,7 @@ class CategoryService:
             image_url=image_url
         )
         await category.insert()
+        category_cache.invalidate_tags("list")
         return category
     
     @staticmethod
@@ -31,6 +33,7 @@ class CategoryService:
             if value is not None:
                 setattr(category, key, value)
         await category.save()
+        category_cache.invalidate_tags("list", f"category:{category_id}")
         return category
     
     @staticmethod
@@ -38,5 +41,6 @@ class CategoryService:
         category = await Category.get(category_id)
         if category:
             await category.delete()
+            category_cache.invalidate_tags("list", f"category:{category_id}")
             return True
         return False
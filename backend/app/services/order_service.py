@@ -1,52 +1,217 @@
+import asyncio
+import logging
 from fastapi import HTTPException
-from app.models.order import Order, OrderCreate, OrderStatus, DeliveryType, GuestOrderCreate, OrderItemCreate
+from app.models.order import Order, OrderCreate, OrderFilters, OrderLine, OrderPage, OrderStatus, DeliveryType, GuestOrderCreate, OrderItemCreate
 from app.models.user import User
 from app.models.products import Product
+from app.services.product import ProductService
 from app.services.zr_service import zr_express_service
-from typing import List, Optional
+from typing import Dict, List, Optional, Type, Union
+from pydantic import BaseModel
 from datetime import datetime
 from beanie import PydanticObjectId
+from bson import ObjectId
+from pymongo import DESCENDING, UpdateOne
+from pymongo.errors import OperationFailure
+from app.cache import invalidate_product
+from app.utils import keyset_filter
+from app.projection import projection_model
+
+logger = logging.getLogger(__name__)
+
+# Newest first, _id breaking ties so keyset cursors are stable
+ORDER_LISTING_SORT = [("created_at", DESCENDING), ("_id", DESCENDING)]
+# Customer fields the admin order listing shows
+ORDER_CUSTOMER_FIELDS = ("email", "full_name", "phone_number")
+# Order timestamps are stored in UTC; weekday stats follow the shop's clock
+ORDER_STATS_TIMEZONE = "Africa/Algiers"
+# Mongo error code for transactions on a standalone server
+_ILLEGAL_OPERATION = 20
+# Flipped to False the first time the server turns a transaction down
+_transactions_supported = True
 
 
 class OrderService:
 
     @staticmethod
-    async def create_order(student: User, items: List[OrderCreate]) -> Order:
-        order_items: List[tuple[Product, int]] = []
-
+    async def resolve_items(items: List[Union[OrderItemCreate, OrderCreate]]) -> List[tuple[Product, int]]:
+        """
+        Resolve every order line with one $in query and validate it in
+        memory: lines for the same product are merged, unknown ids and
+        insufficient stock are reported for all lines at once.
+        """
+        quantities: Dict[str, int] = {}
         for item in items:
-            product = await Product.get(item.product_id)
-            if not product:
-                raise HTTPException(status_code=404, detail=f"Product not found: {item.product_id}")
-            order_items.append((product, item.quantity))
+            if item.quantity <= 0:
+                raise HTTPException(status_code=400, detail=f"Invalid quantity for product: {item.product_id}")
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+
+        products = await ProductService.get_products_by_ids(list(quantities))
+        missing = [product_id for product_id in quantities if product_id not in products]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Product not found: {', '.join(missing)}")
+
+        short = [
+            products[product_id].title
+            for product_id, quantity in quantities.items()
+            if products[product_id].stock_quantity < quantity
+        ]
+        if short:
+            raise HTTPException(status_code=400, detail=f"Insufficient stock for product: {', '.join(short)}")
+        return [(products[product_id], quantity) for product_id, quantity in quantities.items()]
+
+    @staticmethod
+    async def place_order(order: Order, order_items: List[tuple[Product, int]]) -> None:
+        """
+        Reserve stock for every line and insert the order, all or nothing.
+        Each line is a conditional `$inc` that only applies while enough
+        stock is left, so concurrent checkouts can never oversell. On a
+        replica set this runs as one bulk_write plus the insert inside a
+        transaction; a standalone server gets per-line updates with
+        compensation instead.
+        """
+        global _transactions_supported
+        if _transactions_supported:
+            try:
+                await OrderService._place_in_transaction(order, order_items)
+                OrderService._invalidate_stock(order_items)
+                return
+            except OperationFailure as e:
+                if e.code != _ILLEGAL_OPERATION:
+                    raise
+                logger.warning("MongoDB transactions unavailable, reserving stock with compensation")
+                _transactions_supported = False
+        await OrderService._place_with_compensation(order, order_items)
+        OrderService._invalidate_stock(order_items)
+
+    @staticmethod
+    def _reserve_update(product_id, quantity: int) -> tuple[dict, dict]:
+        """(filter, update) taking `quantity` out of stock only if that much is left"""
+        return (
+            {"_id": product_id, "stock_quantity": {"$gte": quantity}},
+            {"$inc": {"stock_quantity": -quantity}, "$set": {"updated_at": datetime.utcnow()}},
+        )
+
+    @staticmethod
+    def _release_op(product_id, quantity: int) -> UpdateOne:
+        return UpdateOne(
+            {"_id": product_id},
+            {"$inc": {"stock_quantity": quantity}, "$set": {"updated_at": datetime.utcnow()}},
+        )
+
+    @staticmethod
+    async def _place_in_transaction(order: Order, order_items: List[tuple[Product, int]]) -> None:
+        collection = Product.get_pymongo_collection()
+        operations = [
+            UpdateOne(*OrderService._reserve_update(product.id, quantity)) for product, quantity in order_items
+        ]
+
+        async def reserve_and_insert(session):
+            result = await collection.bulk_write(operations, ordered=False, session=session)
+            if result.modified_count != len(operations):
+                # Raising aborts the transaction, so no line stays reserved
+                raise await OrderService._out_of_stock(order_items)
+            order.stock_reserved = True
+            await order.insert(session=session)
+
+        async with collection.database.client.start_session() as session:
+            # with_transaction retries write conflicts between concurrent checkouts
+            await session.with_transaction(reserve_and_insert)
+
+    @staticmethod
+    async def _place_with_compensation(order: Order, order_items: List[tuple[Product, int]]) -> None:
+        collection = Product.get_pymongo_collection()
+        results = await asyncio.gather(*(
+            collection.update_one(*OrderService._reserve_update(product.id, quantity))
+            for product, quantity in order_items
+        ))
+        reserved = [
+            (product.id, quantity)
+            for (product, quantity), result in zip(order_items, results)
+            if result.modified_count == 1
+        ]
+        if len(reserved) != len(order_items):
+            await OrderService._release_lines(reserved)
+            raise await OrderService._out_of_stock(order_items)
+
+        order.stock_reserved = True
+        try:
+            await order.insert()
+        except Exception:
+            await OrderService._release_lines(reserved)
+            raise
+
+    @staticmethod
+    async def _out_of_stock(order_items: List[tuple[Product, int]]) -> HTTPException:
+        """Error naming the lines that no longer have enough stock"""
+        current = await ProductService.get_products_by_ids([str(product.id) for product, _ in order_items])
+        short = [
+            product.title
+            for product, quantity in order_items
+            if str(product.id) not in current or current[str(product.id)].stock_quantity < quantity
+        ]
+        return HTTPException(
+            status_code=400,
+            detail=f"Insufficient stock for product: {', '.join(short) or 'stock changed, please retry'}",
+        )
+
+    @staticmethod
+    async def _release_lines(lines: List[tuple[ObjectId, int]]) -> None:
+        if lines:
+            await Product.get_pymongo_collection().bulk_write(
+                [OrderService._release_op(product_id, quantity) for product_id, quantity in lines],
+                ordered=False,
+            )
+
+    @staticmethod
+    def _invalidate_stock(order_items: List[tuple[Product, int]]) -> None:
+        for product, _ in order_items:
+            invalidate_product(str(product.id), product.category)
+
+    @staticmethod
+    async def release_stock(order: Order) -> bool:
+        """
+        Put an order's reserved quantities back into stock. The reservation
+        flag is cleared atomically first, so a release happens at most once.
+        """
+        claimed = await Order.get_pymongo_collection().find_one_and_update(
+            {"_id": order.id, "stock_reserved": True},
+            {"$set": {"stock_reserved": False}},
+        )
+        order.stock_reserved = False
+        if claimed is None:
+            return False
+        await OrderService._release_lines([(line.product_id, line.quantity) for line in order.lines])
+        for line in order.lines:
+            invalidate_product(str(line.product_id), line.category)
+        return True
+
+    @staticmethod
+    async def create_order(student: User, items: List[OrderCreate]) -> Order:
+        order_items = await OrderService.resolve_items(items)
 
         delivery_type = items[0].delivery_type if items else DeliveryType.DELIVERY
         delivery_address = items[0].delivery_address if items else None
         delivery_phone = items[0].delivery_phone if items else None
 
+        lines = [OrderLine.from_product(product, quantity) for product, quantity in order_items]
         order = Order(
             student=student,
-            item=order_items,
+            lines=lines,
+            total_dzd=sum(line.subtotal_dzd for line in lines),
             delivery_type=delivery_type,
             delivery_address=delivery_address,
             delivery_phone=delivery_phone,
             is_guest_order=False
         )
-        await order.insert()
+        await OrderService.place_order(order, order_items)
         return order
 
     @staticmethod
     async def create_guest_order(order_data: GuestOrderCreate) -> Order:
         """Create an order for guest users (no authentication required)"""
-        order_items: List[tuple[Product, int]] = []
-
-        for item in order_data.items:
-            product = await Product.get(item.product_id)
-            if not product:
-                raise HTTPException(status_code=404, detail=f"Product not found: {item.product_id}")
-            if product.stock_quantity < item.quantity:
-                raise HTTPException(status_code=400, detail=f"Insufficient stock for product: {product.title}")
-            order_items.append((product, item.quantity))
+        order_items = await OrderService.resolve_items(order_data.items)
+        lines = [OrderLine.from_product(product, quantity) for product, quantity in order_items]
 
         order = Order(
             student=None,
@@ -54,18 +219,75 @@ class OrderService:
             guest_name=order_data.guest_name,
             guest_phone=order_data.guest_phone,
             guest_email=order_data.guest_email,
-            item=order_items,
+            lines=lines,
+            total_dzd=sum(line.subtotal_dzd for line in lines),
             delivery_type=order_data.delivery_type,
             delivery_address=order_data.delivery_address,
             delivery_phone=order_data.guest_phone,
             wilaya=order_data.wilaya
         )
-        await order.insert()
+        await OrderService.place_order(order, order_items)
         return order
 
     @staticmethod
-    async def get_orders_by_student(student_id: str) -> List[Order]:
-        return await Order.find(Order.student.id == PydanticObjectId(student_id)).sort("-created_at").to_list()
+    async def get_orders_by_student(
+        student_id: str, page: OrderPage, projection: Optional[Type[BaseModel]] = None
+    ) -> tuple[List[Order], Optional[int]]:
+        """A customer's orders, one page at a time like page_orders"""
+        query = {"student.$id": PydanticObjectId(student_id)}
+        return await OrderService.page_orders(query, page, projection)
+
+    @staticmethod
+    def build_admin_filter(filters: OrderFilters) -> dict:
+        """
+        Mongo filter for an admin listing, without the page cursor so it can
+        also be counted. Each narrowing field leads one of Order's indexes.
+        """
+        query = {}
+        if filters.status is not None:
+            query["status"] = filters.status
+        if filters.wilaya:
+            query["wilaya"] = filters.wilaya
+        if filters.delivery_type is not None:
+            query["delivery_type"] = filters.delivery_type
+        if filters.guest is not None:
+            query["is_guest_order"] = True if filters.guest else {"$ne": True}
+        if filters.created_from is not None or filters.created_to is not None:
+            query["created_at"] = {}
+            if filters.created_from is not None:
+                query["created_at"]["$gte"] = filters.created_from
+            if filters.created_to is not None:
+                query["created_at"]["$lt"] = filters.created_to
+        return query
+
+    @staticmethod
+    def zone_filter(query: dict, customer_ids: List) -> dict:
+        """Restrict `query` to guest orders and orders from `customer_ids`, a regular admin's zone"""
+        return {"$and": [query, {"$or": [
+            {"is_guest_order": True},
+            {"student.$id": {"$in": customer_ids}},
+        ]}]}
+
+    @staticmethod
+    def after_cursor(query: dict, after: Optional[str]) -> dict:
+        return {"$and": [query, keyset_filter(after)]} if after else query
+
+    @staticmethod
+    async def page_orders(
+        query: dict, filters: OrderPage, projection: Optional[Type[BaseModel]] = None
+    ) -> tuple[List[Order], Optional[int]]:
+        """
+        One newest-first page of `query` after `filters.after`, and how many
+        orders match in total. The count is only run for the first page
+        (no cursor); later pages return None.
+        """
+        find = Order.find(OrderService.after_cursor(query, filters.after)).sort(ORDER_LISTING_SORT).limit(filters.limit)
+        if projection is not None:
+            find = find.project(projection)
+        if filters.after:
+            return await find.to_list(), None
+        orders, total = await asyncio.gather(find.to_list(), Order.find(query).count())
+        return orders, total
 
     @staticmethod
     async def get_all_orders(status: Optional[OrderStatus] = None) -> List[Order]:
@@ -74,8 +296,72 @@ class OrderService:
         return await Order.find_all().sort("-created_at").to_list()
 
     @staticmethod
-    async def get_orders_by_admin(admin_id: str) -> List[Order]:
-        return await Order.find(Order.assigned_admin == PydanticObjectId(admin_id)).sort("-created_at").to_list()
+    async def admin_scope(era: Optional[str], filters: OrderFilters, all_zones: bool) -> dict:
+        """build_admin_filter, restricted to the admin's zone unless `all_zones`"""
+        query = OrderService.build_admin_filter(filters)
+        if all_zones:
+            return query
+        zone_customer_ids = []
+        if era:
+            zone_customer_ids = await User.get_pymongo_collection().distinct("_id", {"era": era})
+        return OrderService.zone_filter(query, zone_customer_ids)
+
+    @staticmethod
+    async def get_admin_order_stats(era: Optional[str], filters: OrderFilters, all_zones: bool = False) -> dict:
+        """
+        Counts over every order an admin listing matches, not just one page:
+        total, per status and per weekday (Sunday first, in the shop's time
+        zone). One $facet aggregation; the cursor and limit are ignored.
+        """
+        query = await OrderService.admin_scope(era, filters, all_zones)
+        pipeline = [
+            {"$match": query},
+            {"$facet": {
+                "status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+                "weekday": [{"$group": {
+                    "_id": {"$dayOfWeek": {"date": "$created_at", "timezone": ORDER_STATS_TIMEZONE}},
+                    "count": {"$sum": 1},
+                }}],
+            }},
+        ]
+        raw = (await Order.aggregate(pipeline).to_list())[0]
+        by_weekday = [0] * 7
+        for bucket in raw["weekday"]:
+            by_weekday[bucket["_id"] - 1] = bucket["count"]
+        by_status = {bucket["_id"]: bucket["count"] for bucket in raw["status"]}
+        return {"total": sum(by_status.values()), "by_status": by_status, "by_weekday": by_weekday}
+
+    @staticmethod
+    async def get_admin_orders(
+        era: Optional[str], filters: OrderFilters, all_zones: bool = False
+    ) -> tuple[List[tuple[Order, Optional[BaseModel]]], Optional[int]]:
+        """
+        A page of orders paired with their customer, and the total matching
+        count (first page only). Customers come from one batched $in query instead of a fetch
+        per order. Unless `all_zones`, only guest orders and orders from
+        customers in `era` are matched, in the query itself.
+        """
+        query = await OrderService.admin_scope(era, filters, all_zones)
+        orders, total = await OrderService.page_orders(query, filters)
+
+        student_ids = {order.student.ref.id for order in orders if order.student}
+        customers = []
+        if student_ids:
+            # Only what serialize_order_F shows, never the password hash
+            customers = await User.find({"_id": {"$in": list(student_ids)}}).project(
+                projection_model(User, ORDER_CUSTOMER_FIELDS)
+            ).to_list()
+        by_id = {customer.id: customer for customer in customers}
+        return [
+            (order, by_id.get(order.student.ref.id) if order.student else None)
+            for order in orders
+        ], total
+
+    @staticmethod
+    async def get_orders_by_admin(admin_id: str, page: OrderPage) -> tuple[List[Order], Optional[int]]:
+        """Orders assigned to an admin, one page at a time like page_orders"""
+        query = {"assigned_admin.$id": PydanticObjectId(admin_id)}
+        return await OrderService.page_orders(query, page)
 
     @staticmethod
     async def accept_order_for_printing(order_id: str, admin: User) -> Optional[Order]:
@@ -96,6 +382,7 @@ class OrderService:
             return None
         order.status = OrderStatus.DECLINED
         order.assigned_admin = admin
+        await OrderService.release_stock(order)
         await order.save()
         return order
 
@@ -165,6 +452,9 @@ class OrderService:
     async def delete_order(order_id: str) -> bool:
         order = await Order.get(order_id)
         if order:
+            # Delivered goods have left the stock for good
+            if order.status != OrderStatus.DELIVERED:
+                await OrderService.release_stock(order)
             await order.delete()
             return True
         return False
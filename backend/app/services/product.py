@@ -1,30 +1,54 @@
+import re
 from app.models.products import Product
-from typing import List, Optional
+from app.cache import invalidate_product, make_key, product_cache, product_list_tag
+from app.projection import projection_model
+from app.utils import clean_param, keyset_filter, search_key, search_words
+from fastapi import HTTPException
+from bson import ObjectId
+from typing import Dict, Iterable, List, Optional
 from datetime import datetime
+from pymongo import DESCENDING
+
+
+# Price facet buckets in DZD; anything above the last boundary lands in "other".
+PRICE_FACET_BOUNDARIES = [0, 1000, 2500, 5000, 10000, 20000, 50000]
 
 
 class ProductService:
-    
+
     @staticmethod
-    async def filter_products(
+    def build_filter(
         title: Optional[str] = None,
         category: Optional[str] = None,
         min_price: Optional[float] = None,
         max_price: Optional[float] = None,
         brand: Optional[str] = None,
-        skip: int = 0,
-        limit: int = 10
-    ) -> List[Product]:
+        after: Optional[str] = None,
+        title_prefix: bool = False,
+    ) -> dict:
+        """
+        Build the Mongo filter shared by every product listing query.
+        `title` is a full-text search over title, brand and description, or
+        with `title_prefix` every searched word must start a word of the
+        title. `brand` matches the whole brand, ignoring case and accents.
+        `after` is a cursor returned with a previous newest-first page.
+        """
         query = {}
+        title, category, brand = clean_param(title), clean_param(category), clean_param(brand)
 
-        if title:
-            query["title"] = {"$regex": f".*{title}.*", "$options": "i"}
+        if title and title_prefix:
+            # Anchored on lowercased keys, so each regex is an index range scan
+            query["title_words"] = {
+                "$all": [re.compile("^" + re.escape(word)) for word in search_words(title)]
+            }
+        elif title:
+            query["$text"] = {"$search": title}
 
         if category:
             query["category"] = category
         
         if brand:
-            query["brand"] = {"$regex": f".*{brand}.*", "$options": "i"}
+            query["brand_key"] = search_key(brand)
 
         if min_price is not None or max_price is not None:
             query["price_dzd"] = {}
@@ -33,13 +57,164 @@ class ProductService:
             if max_price is not None:
                 query["price_dzd"]["$lte"] = max_price
 
-        return await Product.find(query).sort("-created_at").skip(skip).limit(limit).to_list()
+        if after:
+            if title:
+                raise HTTPException(status_code=400, detail="Cursor pagination is not available for search results")
+            query.update(keyset_filter(after))
+
+        return query
+
+    @staticmethod
+    def sort_for(query: dict) -> list:
+        """
+        Search results are ranked by relevance, everything else is newest first
+        with _id as tie-breaker so cursors and offsets are stable.
+        """
+        if "$text" in query:
+            return [("score", {"$meta": "textScore"}), ("created_at", DESCENDING)]
+        return [("created_at", DESCENDING), ("_id", DESCENDING)]
+
+    @staticmethod
+    async def filter_products(
+        title: Optional[str] = None,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        brand: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 10,
+        after: Optional[str] = None,
+        projection: Optional[Iterable[str]] = None,
+    ) -> list:
+        """
+        One page of products, or of `projection` models when fields are
+        given. A title search matches whole words through the text index;
+        when that finds nothing at all, each searched word is matched as the
+        start of a title word instead, so "prot" still finds "Protéine".
+        """
+        if after:
+            skip = 0
+        query = ProductService.build_filter(title, category, min_price, max_price, brand, after)
+        products = await ProductService._find_page(query, skip, limit, projection)
+        if not products and "$text" in query and (skip == 0 or await Product.find_one(query) is None):
+            query = ProductService.build_filter(title, category, min_price, max_price, brand, title_prefix=True)
+            products = await ProductService._find_page(query, skip, limit, projection)
+        return products
+
+    @staticmethod
+    async def _find_page(query: dict, skip: int, limit: int, projection: Optional[Iterable[str]]) -> list:
+        find = Product.find(query).sort(ProductService.sort_for(query)).skip(skip).limit(limit)
+        if projection is not None:
+            find = find.project(projection_model(Product, projection))
+        return await find.to_list()
+
+    @staticmethod
+    def _facet_count_stages() -> dict:
+        return {
+            "total": [{"$count": "count"}],
+            "category": [{"$sortByCount": "$category"}],
+            "brand": [
+                {"$match": {"brand": {"$nin": [None, ""]}}},
+                {"$sortByCount": "$brand"},
+            ],
+            "price": [
+                {
+                    "$bucket": {
+                        "groupBy": "$price_dzd",
+                        "boundaries": PRICE_FACET_BOUNDARIES,
+                        "default": "other",
+                        "output": {"count": {"$sum": 1}},
+                    }
+                }
+            ],
+        }
+
+    @staticmethod
+    async def _facet(query: dict, skip: int, limit: int) -> dict:
+        pipeline = [
+            {"$match": query},
+            {
+                "$facet": {
+                    "items": [
+                        {"$sort": dict(ProductService.sort_for(query))}, {"$skip": skip}, {"$limit": limit},
+                    ],
+                    **ProductService._facet_count_stages(),
+                }
+            },
+        ]
+        return (await Product.aggregate(pipeline).to_list())[0]
+
+    @staticmethod
+    def _format_facet_counts(raw: dict) -> dict:
+        price = []
+        bounds = PRICE_FACET_BOUNDARIES
+        for bucket in raw["price"]:
+            if bucket["_id"] == "other":
+                price.append({"min": bounds[-1], "max": None, "count": bucket["count"]})
+            else:
+                upper = bounds[bounds.index(bucket["_id"]) + 1]
+                price.append({"min": bucket["_id"], "max": upper, "count": bucket["count"]})
+        return {
+            "total": raw["total"][0]["count"] if raw["total"] else 0,
+            "facets": {
+                "category": [{"value": b["_id"], "count": b["count"]} for b in raw["category"]],
+                "brand": [{"value": b["_id"], "count": b["count"]} for b in raw["brand"]],
+                "price": price,
+            },
+        }
+
+    @staticmethod
+    async def facet_products(
+        title: Optional[str] = None,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        brand: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 10,
+    ) -> tuple[List[Product], dict]:
+        """
+        One page of products plus total and category/brand/price counts over
+        the whole filtered set, computed by a single $facet aggregation.
+        Counts for unfiltered and category-only queries are cached.
+        """
+        title, category, brand = clean_param(title), clean_param(category), clean_param(brand)
+        query = ProductService.build_filter(title, category, min_price, max_price, brand)
+
+        counts_key = None
+        if not (title or brand or min_price is not None or max_price is not None):
+            counts_key = make_key("facets", category=category)
+            counts = product_cache.get(counts_key)
+            if counts is not None:
+                products = await ProductService._find_page(query, skip, limit, None)
+                return products, counts
+
+        raw = await ProductService._facet(query, skip, limit)
+        if not raw["total"] and "$text" in query:
+            # Same prefix fallback as filter_products
+            query = ProductService.build_filter(title, category, min_price, max_price, brand, title_prefix=True)
+            raw = await ProductService._facet(query, skip, limit)
+        counts = ProductService._format_facet_counts(raw)
+        if counts_key is not None:
+            product_cache.set(counts_key, counts, tags=[product_list_tag(category)])
+
+        products = [Product.model_validate(doc) for doc in raw["items"]]
+        return products, counts
     
 
     @staticmethod
     async def get_product_by_id(product_id: str) -> Optional[Product]:
         return await Product.get(product_id)
 
+    @staticmethod
+    async def get_products_by_ids(product_ids: List[str]) -> Dict[str, Product]:
+        """Resolve ids with a single $in query, keyed by id; invalid and unknown ids are absent"""
+        object_ids = list({ObjectId(pid) for pid in product_ids if ObjectId.is_valid(pid)})
+        if not object_ids:
+            return {}
+        products = await Product.find({"_id": {"$in": object_ids}}).to_list()
+        return {str(product.id): product for product in products}
+
     @staticmethod
     async def create_product(
         title: str,
@@ -66,6 +241,7 @@ class ProductService:
             weight=weight,
         )
         await product.insert()
+        invalidate_product(None, product.category)
         return product
 
     @staticmethod
@@ -78,9 +254,11 @@ class ProductService:
         product = await Product.get(product_id)
         if not product:
             return None
+        previous_category = product.category
         for key, value in data.items():
             setattr(product, key, value)
         await product.save()
+        invalidate_product(product_id, previous_category, product.category)
         return product
 
     @staticmethod
@@ -88,12 +266,13 @@ class ProductService:
         product = await Product.get(product_id)
         if product:
             await product.delete()
+            invalidate_product(product_id, product.category)
             return True
         return False
 
     @staticmethod
-    async def search_products_by_title(keyword: str) -> List[Product]:
-        return await Product.find(Product.title.regex(f".*{keyword}.*", "i")).to_list()
+    async def search_products_by_title(keyword: str, skip: int = 0, limit: int = 10) -> List[Product]:
+        return await ProductService.filter_products(title=keyword, skip=skip, limit=limit)
     
 
     @staticmethod
@@ -0,0 +1,64 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List
+
+from app import exceptions
+from app.config import settings
+from app.minio import ImageBucket
+from app.models.order import Order
+from app.models.products import Product
+
+logger = logging.getLogger(__name__)
+
+
+class ProductImageService:
+    """
+    Reference counting for content-addressed product images. One stored image
+    can back several products and order lines, so an image is only deleted
+    once no product lists it in `image_urls` and no order snapshot shows it
+    in `lines.image_url` (both served by multikey indexes).
+    """
+
+    @staticmethod
+    async def ref_count(image_id: str) -> int:
+        products = await Product.find({"image_urls": image_id}).count()
+        if products:
+            return products
+        return await Order.find({"lines.image_url": image_id}).count()
+
+    @staticmethod
+    async def release(image_bucket: ImageBucket, image_ids: Iterable[str]) -> List[str]:
+        """
+        Delete the given images (and their variants) that no product
+        references any more. Returns the ids actually deleted.
+
+        Like the orphan sweeper, images modified within IMAGE_GC_GRACE_SECONDS
+        are kept: an upload of the same bytes refreshes the stored image
+        (ImageBucket.put_new) before its product is saved, so a recent image
+        may be about to be referenced again. Those are left to image_gc,
+        which also covers the fresh images of rolled back requests.
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.IMAGE_GC_GRACE_SECONDS)
+        deleted = []
+        for image_id in dict.fromkeys(image_ids):
+            if await ProductImageService.ref_count(image_id) > 0:
+                continue
+            try:
+                _, last_modified = await image_bucket.stat(image_id)
+            except exceptions.NotFound:
+                continue
+            except Exception as e:
+                logger.error(f"Failed to stat image {image_id}: {e}")
+                continue
+            if last_modified is None or last_modified > cutoff:
+                continue
+            try:
+                errors = await image_bucket.delete_image(image_id)
+            except Exception as e:
+                errors = [str(e)]
+            if errors:
+                # Left for the orphan sweeper
+                logger.error(f"Failed to delete image {image_id}: {'; '.join(errors)}")
+                continue
+            deleted.append(image_id)
+        return deleted
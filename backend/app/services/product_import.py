@@ -0,0 +1,257 @@
+import asyncio
+import csv
+import datetime
+import io
+import ipaddress
+import json
+import os
+import socket
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+from fastapi import HTTPException, UploadFile
+from pydantic import ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from starlette.datastructures import Headers
+
+from app import exceptions
+from app.cache import product_cache
+from app.minio import ImageBucket
+from app.models.products import Product, ProductImportRow
+from app.utils import search_key, search_words
+
+IMPORT_BATCH_SIZE = 500
+IMAGE_FETCH_CONCURRENCY = 8
+IMAGE_FETCH_TIMEOUT = 20.0
+IMAGE_FETCH_MAX_REDIRECTS = 5
+# The report keeps every count but stops listing individual errors past this
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+
+    def fail(self, row: int, error: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": error})
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+class ProductImportService:
+    """
+    Streaming bulk import of products from CSV or NDJSON.
+
+    Rows are read lazily from the (disk-spooled) upload and handled in batches
+    of IMPORT_BATCH_SIZE: each batch is validated against ProductImportRow, has
+    its remote images copied into the bucket concurrently, and is written with
+    one unordered bulk_write of upserts keyed by sku (or title when a row has
+    no sku). Only one batch is held in memory at a time.
+    """
+
+    def __init__(self, image_bucket: ImageBucket):
+        self.image_bucket = image_bucket
+
+    @staticmethod
+    def detect_format(upload: UploadFile, fmt: Optional[str]) -> str:
+        if fmt:
+            fmt = fmt.lower()
+        else:
+            ext = os.path.splitext(upload.filename or "")[1].lower()
+            fmt = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}.get(ext)
+            if fmt is None and upload.content_type in ("application/x-ndjson", "application/jsonl"):
+                fmt = "ndjson"
+            elif fmt is None and upload.content_type == "text/csv":
+                fmt = "csv"
+        if fmt not in ("csv", "ndjson"):
+            raise HTTPException(status_code=400, detail="Import file must be CSV or NDJSON")
+        return fmt
+
+    @staticmethod
+    def _iter_rows(upload: UploadFile, fmt: str) -> Iterator[Tuple[int, object]]:
+        """Yield (row number, raw row) pairs; row numbers are 1-based data rows"""
+        text = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+        if fmt == "csv":
+            for number, row in enumerate(csv.DictReader(text), start=1):
+                # Empty cells mean "not provided", not an empty string
+                yield number, {k: v for k, v in row.items() if k and v not in (None, "")}
+        else:
+            number = 0
+            for line in text:
+                if not line.strip():
+                    continue
+                number += 1
+                try:
+                    yield number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield number, e
+
+    async def import_file(self, upload: UploadFile, fmt: Optional[str] = None) -> dict:
+        fmt = self.detect_format(upload, fmt)
+        report = ImportReport()
+        batch: List[Tuple[int, ProductImportRow]] = []
+
+        # Redirects are followed by hand so every hop's target is checked
+        async with httpx.AsyncClient(timeout=IMAGE_FETCH_TIMEOUT, follow_redirects=False) as http:
+            for number, raw in self._iter_rows(upload, fmt):
+                report.rows += 1
+                if isinstance(raw, Exception):
+                    report.fail(number, f"Invalid JSON: {raw}")
+                    continue
+                try:
+                    batch.append((number, ProductImportRow.model_validate(raw)))
+                except ValidationError as e:
+                    report.fail(number, "; ".join(
+                        f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+                    ))
+                    continue
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    await self._write_batch(batch, http, report)
+                    batch = []
+            if batch:
+                await self._write_batch(batch, http, report)
+
+        # Upserts can touch any category and any cached product
+        product_cache.clear()
+        return report.as_dict()
+
+    @staticmethod
+    async def _check_public_url(url: str) -> None:
+        """
+        Refuse URLs whose host resolves to a private, loopback, link-local or
+        otherwise non-public address, so an import can't reach internal
+        services (cloud metadata, MinIO, Mongo).
+        """
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise ValueError(f"Unsupported image URL: {url}")
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(parsed.hostname, port, type=socket.SOCK_STREAM)
+        except socket.gaierror:
+            raise ValueError(f"Cannot resolve {parsed.hostname}")
+        for *_, sockaddr in infos:
+            address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+            if not address.is_global:
+                raise ValueError(f"{parsed.hostname} resolves to a non-public address")
+
+    async def _fetch_image(self, url: str, http: httpx.AsyncClient, semaphore: asyncio.Semaphore) -> str:
+        scheme = urlparse(url).scheme
+        if not scheme:
+            # Already an object name in the bucket
+            try:
+                await self.image_bucket.stat(url)
+            except exceptions.NotFound:
+                raise ValueError(f"Image {url} does not exist in the bucket")
+            return url
+        limit = self.image_bucket.max_upload_bytes
+        async with semaphore:
+            for _ in range(IMAGE_FETCH_MAX_REDIRECTS + 1):
+                await self._check_public_url(url)
+                async with http.stream("GET", url) as response:
+                    if response.is_redirect:
+                        url = str(response.next_request.url)
+                        continue
+                    response.raise_for_status()
+                    content_type = response.headers.get("content-type", "").split(";")[0].strip()
+                    body = bytearray()
+                    # Stop reading a remote image as soon as it is over the limit
+                    async for chunk in response.aiter_bytes():
+                        body.extend(chunk)
+                        if limit is not None and len(body) > limit:
+                            raise ValueError(f"larger than {limit} bytes")
+                    break
+            else:
+                raise ValueError(f"More than {IMAGE_FETCH_MAX_REDIRECTS} redirects")
+        filename = os.path.basename(urlparse(url).path) or "image"
+        upload = UploadFile(
+            file=io.BytesIO(body),
+            filename=filename,
+            headers=Headers({"content-type": content_type}),
+        )
+        return await self.image_bucket.put(upload)
+
+    async def _resolve_images(
+        self, batch: List[Tuple[int, ProductImportRow]], http: httpx.AsyncClient, report: ImportReport
+    ) -> List[Tuple[int, ProductImportRow]]:
+        semaphore = asyncio.Semaphore(IMAGE_FETCH_CONCURRENCY)
+
+        async def resolve(row: ProductImportRow) -> List[str]:
+            return list(await asyncio.gather(*(self._fetch_image(url, http, semaphore) for url in row.image_urls)))
+
+        results = await asyncio.gather(*(resolve(row) for _, row in batch), return_exceptions=True)
+        ready = []
+        for (number, row), result in zip(batch, results):
+            if isinstance(result, BaseException):
+                detail = getattr(result, "detail", None) or str(result)
+                report.fail(number, f"Image fetch failed: {detail}")
+                continue
+            if "image_urls" in row.model_fields_set:
+                row.image_urls = result
+            ready.append((number, row))
+        return ready
+
+    async def _write_batch(
+        self, batch: List[Tuple[int, ProductImportRow]], http: httpx.AsyncClient, report: ImportReport
+    ) -> None:
+        # Unordered upserts on the same key could race into two inserts, so
+        # within a batch the last row for a key wins
+        latest: Dict[tuple, int] = {}
+        for position, (number, row) in enumerate(batch):
+            key = ("sku", row.sku) if row.sku else ("title", row.title)
+            if key in latest:
+                report.fail(batch[latest[key]][0], f"Superseded by row {number} with the same {key[0]}")
+            latest[key] = position
+        batch = [batch[position] for position in sorted(latest.values())]
+
+        batch = await self._resolve_images(batch, http, report)
+        if not batch:
+            return
+
+        now = datetime.datetime.utcnow()
+        operations = []
+        for _, row in batch:
+            # Columns missing from the file keep their stored value on update
+            # and only fall back to the model defaults on insert
+            fields = row.model_dump(exclude_unset=True, exclude_none=True)
+            fields["updated_at"] = now
+            # Product's search keys, which raw writes skip
+            fields["title_words"] = search_words(row.title)
+            if "brand" in fields:
+                fields["brand_key"] = search_key(row.brand)
+            defaults = {
+                k: v for k, v in row.model_dump(exclude_none=True).items() if k not in fields
+            }
+            defaults["created_at"] = now
+            key: Dict[str, str] = {"sku": row.sku} if row.sku else {"title": row.title}
+            operations.append(
+                UpdateOne(key, {"$set": fields, "$setOnInsert": defaults}, upsert=True)
+            )
+
+        collection = Product.get_pymongo_collection()
+        try:
+            result = await collection.bulk_write(operations, ordered=False)
+            details = result.bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            for error in details.get("writeErrors", []):
+                report.fail(batch[error["index"]][0], error.get("errmsg", "Write failed"))
+
+        report.inserted += details.get("nUpserted", 0)
+        report.updated += details.get("nModified", 0)
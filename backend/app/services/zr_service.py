@@ -30,10 +30,7 @@ class ZRExpressService:
         try:
 
             
-            total_amount = sum(
-                material.price_dzd * qty 
-                for material, qty in order.item
-            )
+            total_amount = order.total_dzd
             
             
             delivery_data = {
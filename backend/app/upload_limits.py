@@ -0,0 +1,66 @@
+"""
+Request body size limits for upload routes, enforced while the body arrives.
+
+Starlette spools multipart uploads to disk before a route runs, so a limit
+checked inside the route only fires after the whole body has been received.
+This middleware rejects an oversized request from its Content-Length, or as
+soon as the bytes received so far pass the route's limit, before any of it
+reaches a route or MinIO.
+"""
+import re
+from typing import Iterable, Optional, Tuple
+
+from fastapi import HTTPException, status
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+def _too_large(limit: int) -> str:
+    return f"Request body larger than {limit} bytes"
+
+
+class UploadLimitMiddleware:
+    def __init__(self, app: ASGIApp, rules: Iterable[Tuple[str, str, int]]):
+        """`rules` are (method, path regex, max body bytes); unmatched requests are not limited"""
+        self.app = app
+        self.rules = [(method, re.compile(path), limit) for method, path, limit in rules]
+
+    def limit_for(self, scope: Scope) -> Optional[int]:
+        for method, path, limit in self.rules:
+            if scope["method"] == method and path.fullmatch(scope["path"]):
+                return limit
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limit = self.limit_for(scope)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse(
+                {"detail": _too_large(limit)}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # FastAPI re-raises HTTPExceptions from body parsing as-is
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=_too_large(limit)
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
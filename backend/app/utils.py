@@ -1,3 +1,9 @@
+import base64
+import json
+import re
+import unicodedata
+from datetime import datetime
+from bson import ObjectId
 from fastapi import HTTPException, UploadFile, status
 from passlib.context import CryptContext
 from fastapi import BackgroundTasks
@@ -46,6 +52,92 @@ def check_extension(
     return file_ext
 
 
+def sniff_image_extension(head: bytes) -> str | None:
+    """
+    Real image type of a file from its first bytes, as a key of
+    image_ext_content_type_map, or None if unrecognized
+    """
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        return "avif"
+    if head[:4] == b"\x00\x00\x01\x00":
+        return "ico"
+    text = head.lstrip(b"\xef\xbb\xbf").lstrip().lower()
+    if text.startswith((b"<?xml", b"<svg")) and b"<svg" in text:
+        return "svg"
+    return None
+
+
+def sniffed_type_matches(
+    sniffed: str | None, content_type: str | None, ext_content_type_map: dict[str, list[str]]
+) -> bool:
+    """Whether sniffed bytes are consistent with the declared content type"""
+    if sniffed is None or content_type is None:
+        return False
+    # APNG files are PNG files, and .jpg/.jpeg share a signature
+    equivalent = {"png": ["png", "apng"], "jpeg": ["jpeg", "jpg"]}.get(sniffed, [sniffed])
+    return any(content_type in ext_content_type_map.get(ext, []) for ext in equivalent)
+
+
+def clean_param(value: str | None) -> str | None:
+    """Strip a free-text query parameter; blank means not provided"""
+    if value is None:
+        return None
+    return value.strip() or None
+
+
+def search_key(text: str) -> str:
+    """Lowercase `text` and strip its accents, as the text index compares words"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def search_words(text: str | None) -> list[str]:
+    """Distinct words of `text` as search keys, in order"""
+    if not text:
+        return []
+    return list(dict.fromkeys(re.findall(r"\w+", search_key(text))))
+
+
+def encode_cursor(created_at: datetime, document_id) -> str:
+    """Opaque keyset cursor pointing just after a (created_at, _id) position"""
+    raw = json.dumps([created_at.isoformat(), str(document_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, ObjectId]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, document_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), ObjectId(document_id)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor",
+        )
+
+
+def keyset_filter(cursor: str) -> dict:
+    """
+    Mongo filter for documents after `cursor` in a (-created_at, -_id) sort,
+    so the next page is an index seek instead of a skip over previous pages.
+    """
+    created_at, document_id = decode_cursor(cursor)
+    return {
+        "$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": document_id}},
+        ]
+    }
+
+
 async def send_email(email: str, code: str, background_tasks: BackgroundTasks) -> None:
     """
     Sends a password reset email with a 4-digit code in French.
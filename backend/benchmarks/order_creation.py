@@ -0,0 +1,86 @@
+"""
+Order-creation latency as the cart grows, before and after resolving the
+lines with one $in query.
+
+"before" replays the old loop (one `Product.get` per line, in sequence);
+"after" is `OrderService.resolve_items`. "create" is a whole
+`OrderService.create_guest_order`, insert included. Runs against a
+throwaway database on MONGO_URI, which is dropped at the end.
+
+    cd backend && python -m benchmarks.order_creation [--database gymfog_bench] [--rounds 20]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+from beanie import init_beanie
+from pymongo import AsyncMongoClient
+
+from app.config import settings
+from app.models.order import GuestOrderCreate, OrderItemCreate
+from app.models.products import Product
+from app.services.order_service import OrderService
+
+CART_SIZES = [1, 5, 15, 30]
+
+
+async def resolve_before(items: List[OrderItemCreate]) -> list:
+    resolved = []
+    for item in items:
+        product = await Product.get(item.product_id)
+        resolved.append((product, item.quantity))
+    return resolved
+
+
+async def median_ms(rounds: int, fn, *args) -> float:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await fn(*args)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+async def run(database: str, rounds: int) -> None:
+    from app.main import DOCUMENT_MODELS
+
+    if database == settings.MONGO_DB:
+        raise SystemExit("Refusing to benchmark against the application database")
+    client = AsyncMongoClient(settings.MONGO_URI)
+    await init_beanie(database=client[database], document_models=DOCUMENT_MODELS)
+    try:
+        products = [
+            Product(title=f"Bench product {i}", category="bench", price_dzd=1000 + i, stock_quantity=10**9)
+            for i in range(max(CART_SIZES))
+        ]
+        await Product.insert_many(products)
+        products = await Product.find(Product.category == "bench").to_list()
+
+        print(f"median of {rounds} rounds, ms")
+        print(f"{'lines':>5} {'before':>8} {'after':>8} {'create':>8}")
+        for size in CART_SIZES:
+            items = [OrderItemCreate(product_id=str(p.id), quantity=1) for p in products[:size]]
+            order = GuestOrderCreate(
+                guest_name="Bench", guest_phone="0500000000", delivery_address="-", wilaya="16", items=items,
+            )
+            before = await median_ms(rounds, resolve_before, items)
+            after = await median_ms(rounds, OrderService.resolve_items, items)
+            create = await median_ms(rounds, OrderService.create_guest_order, order)
+            print(f"{size:>5} {before:>8.2f} {after:>8.2f} {create:>8.2f}")
+    finally:
+        await client.drop_database(database)
+        await client.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database", default="gymfog_bench")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.database, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Product search latency as the catalog grows, text index against the old
+unanchored regex.
+
+"regex" replays the old `{"$regex": ".*term.*", "$options": "i"}` filter,
+"text" is `ProductService.filter_products(title=...)`, ranked by the text
+index. The catalog is grown to each size in turn; a fixed number of products
+match the searched term at every size, so only the cost of finding them
+changes. Runs against a throwaway database on MONGO_URI, which is dropped at
+the end.
+
+    cd backend && python -m benchmarks.search [--database gymfog_bench] [--rounds 20]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from beanie import init_beanie
+from pymongo import AsyncMongoClient
+
+from app.config import settings
+from app.models.products import Product
+from app.services.product import ProductService
+
+CATALOG_SIZES = [1_000, 10_000, 100_000]
+# Products carrying the searched term, at every catalog size
+MATCHING_PRODUCTS = 50
+SEARCH_TERM = "proteine"
+INSERT_BATCH_SIZE = 5_000
+WORDS = [
+    "whey", "creatine", "gainer", "shaker", "gants", "ceinture", "barre", "vitamine",
+    "omega", "bcaa", "collagene", "legging", "debardeur", "tapis", "haltere", "corde",
+]
+BRANDS = ["Optimum", "Biotech", "Scitec", "MyProtein", "Olimp", "Gymfog"]
+
+
+def product_doc(index: int, matching: bool) -> dict:
+    rng = random.Random(index)
+    words = rng.sample(WORDS, 3)
+    if matching:
+        # Accented on purpose: the index folds diacritics, the regex does not
+        words.append("Protéine")
+    return {
+        "title": " ".join(words).title() + f" {index}",
+        "brand": rng.choice(BRANDS),
+        "description": " ".join(rng.choices(WORDS, k=12)),
+        "category": rng.choice(["supplements", "accessories", "clothing"]),
+        "price_dzd": rng.randint(500, 50_000),
+        "stock_quantity": 10,
+        "image_urls": [],
+    }
+
+
+async def grow_to(size: int, current: int) -> None:
+    collection = Product.get_pymongo_collection()
+    for start in range(current, size, INSERT_BATCH_SIZE):
+        stop = min(start + INSERT_BATCH_SIZE, size)
+        await collection.insert_many([product_doc(i, i < MATCHING_PRODUCTS) for i in range(start, stop)])
+
+
+async def search_regex(limit: int) -> list:
+    query = {"title": {"$regex": f".*{SEARCH_TERM}.*", "$options": "i"}}
+    return await Product.find(query).limit(limit).to_list()
+
+
+async def search_text(limit: int) -> list:
+    return await ProductService.filter_products(title=SEARCH_TERM, limit=limit)
+
+
+async def median_ms(rounds: int, fn, *args) -> float:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await fn(*args)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+async def run(database: str, rounds: int) -> None:
+    from app.main import DOCUMENT_MODELS
+
+    if database == settings.MONGO_DB:
+        raise SystemExit("Refusing to benchmark against the application database")
+    client = AsyncMongoClient(settings.MONGO_URI)
+    await init_beanie(database=client[database], document_models=DOCUMENT_MODELS)
+    try:
+        print(f"median of {rounds} rounds, ms; {MATCHING_PRODUCTS} products match '{SEARCH_TERM}'")
+        print(f"{'products':>8} {'regex':>8} {'text':>8} {'hits':>5}")
+        current = 0
+        for size in CATALOG_SIZES:
+            await grow_to(size, current)
+            current = size
+            hits = len(await search_text(MATCHING_PRODUCTS))
+            regex = await median_ms(rounds, search_regex, 20)
+            text = await median_ms(rounds, search_text, 20)
+            print(f"{size:>8} {regex:>8.2f} {text:>8.2f} {hits:>5}")
+    finally:
+        await client.drop_database(database)
+        await client.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database", default="gymfog_bench")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.database, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
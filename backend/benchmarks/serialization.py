@@ -0,0 +1,90 @@
+"""
+Per-item cost of rendering a product list response, before and after the
+orjson serializer.
+
+"before" replays what FastAPI did for `response_model=List[dict]`: validate
+the list, dump it to JSON-compatible Python, then `json.dumps` it the way
+Starlette's JSONResponse renders. "after" is `app.serializers.dumps`, which
+is all a route returning ORJSONResponse does.
+
+    cd backend && python -m benchmarks.serialization [--items 10000] [--rounds 5]
+"""
+import argparse
+import datetime
+import json
+import time
+from typing import List
+
+from bson import ObjectId
+from pydantic import TypeAdapter
+
+from app.models.products import Product
+from app.serializers import dumps, serialize_product
+
+
+def make_items(count: int) -> List[dict]:
+    now = datetime.datetime.utcnow()
+    return [
+        serialize_product(
+            Product.model_construct(
+                id=ObjectId(),
+                title=f"Whey protéine {i}",
+                description="Protéine de lactosérum, 2 kg, saveur chocolat. " * 4,
+                image_urls=[f"{ObjectId()}" for _ in range(4)],
+                category="supplements",
+                price_dzd=4500.0 + i,
+                stock_quantity=i % 40,
+                brand="GymFog",
+                sizes=["S", "M", "L"],
+                colors=["black", "white"],
+                weight=2.0,
+                created_at=now,
+                updated_at=now,
+            )
+        )
+        for i in range(count)
+    ]
+
+
+def render_before(items: List[dict], adapter: TypeAdapter) -> bytes:
+    validated = adapter.validate_python(items)
+    content = adapter.dump_python(validated, mode="json")
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def render_after(items: List[dict]) -> bytes:
+    return dumps(items)
+
+
+def best_of(rounds: int, fn, *args) -> float:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    items = make_items(args.items)
+    adapter = TypeAdapter(List[dict])
+    assert json.loads(render_before(items, adapter)) == json.loads(render_after(items))
+
+    before = best_of(args.rounds, render_before, items, adapter)
+    after = best_of(args.rounds, render_after, items)
+    size = len(render_after(items))
+    print(f"{args.items} items, {size / 1024:.0f} KiB body, best of {args.rounds} rounds")
+    print(f"before (validate + json.dumps): {before * 1e6 / args.items:8.2f} us/item  {before * 1e3:8.1f} ms")
+    print(f"after  (orjson):                {after * 1e6 / args.items:8.2f} us/item  {after * 1e3:8.1f} ms")
+    print(f"speed-up: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
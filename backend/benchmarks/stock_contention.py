@@ -0,0 +1,88 @@
+"""
+Concurrency check for stock reservation: many guest checkouts race for one
+SKU and the script verifies none of them oversold it.
+
+`--stock` units are put on a single product, then `--buyers` concurrent
+orders of one unit each are placed through `OrderService.create_guest_order`.
+Exactly `--stock` orders must succeed, stock must end at 0, and releasing the
+orders (even twice) must give every unit back exactly once. Exits non-zero on any mismatch. Runs
+against a throwaway database on MONGO_URI, which is dropped at the end.
+
+    cd backend && python -m benchmarks.stock_contention [--stock 20] [--buyers 200]
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from beanie import init_beanie
+from fastapi import HTTPException
+from pymongo import AsyncMongoClient
+
+from app.config import settings
+from app.models.order import GuestOrderCreate, OrderItemCreate
+from app.models.products import Product
+from app.services.order_service import OrderService
+
+
+async def run(database: str, stock: int, buyers: int) -> int:
+    from app.main import DOCUMENT_MODELS
+
+    if database == settings.MONGO_DB:
+        raise SystemExit("Refusing to run against the application database")
+    client = AsyncMongoClient(settings.MONGO_URI)
+    await init_beanie(database=client[database], document_models=DOCUMENT_MODELS)
+    try:
+        product = Product(title="Contended SKU", category="bench", price_dzd=1000, stock_quantity=stock)
+        await product.insert()
+        order_data = GuestOrderCreate(
+            guest_name="Bench", guest_phone="0500000000", delivery_address="-", wilaya="16",
+            items=[OrderItemCreate(product_id=str(product.id), quantity=1)],
+        )
+
+        async def buy():
+            try:
+                return await OrderService.create_guest_order(order_data)
+            except HTTPException:
+                return None
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(buy() for _ in range(buyers)))
+        elapsed = time.perf_counter() - start
+        orders = [order for order in results if order is not None]
+        left = (await Product.get(product.id)).stock_quantity
+        print(f"{buyers} buyers for {stock} units in {elapsed * 1000:.0f} ms: "
+              f"{len(orders)} orders placed, {left} units left")
+
+        failures = []
+        if len(orders) != stock:
+            failures.append(f"expected {stock} orders, got {len(orders)}")
+        if left != 0:
+            failures.append(f"expected 0 units left, got {left}")
+
+        # What decline_order and delete_order do; releasing twice must be a no-op
+        await asyncio.gather(*(OrderService.release_stock(order) for order in orders + orders))
+        restored = (await Product.get(product.id)).stock_quantity
+        print(f"after releasing every order twice: {restored} units")
+        if restored != stock:
+            failures.append(f"expected {stock} units after releases, got {restored}")
+
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        return 1 if failures else 0
+    finally:
+        await client.drop_database(database)
+        await client.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database", default="gymfog_bench")
+    parser.add_argument("--stock", type=int, default=20)
+    parser.add_argument("--buyers", type=int, default=200)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.database, args.stock, args.buyers)))
+
+
+if __name__ == "__main__":
+    main()
@@ -51,3 +51,17 @@ export async function getProductById(productId: string): Promise<Product> {
   const product = await apiClient<Product>(`/products/${productId}`);
   return transformProduct(product);
 }
+
+export interface ProductBatchResult {
+  items: Product[];
+  missing: string[];
+}
+
+// Resolve several products (cart, wishlist) in one request, in the given order
+export async function getProductsByIds(productIds: string[]): Promise<ProductBatchResult> {
+  const result = await apiClient<ProductBatchResult>('/products/batch', {
+    method: 'POST',
+    body: JSON.stringify({ ids: productIds }),
+  });
+  return { ...result, items: result.items.map(transformProduct) };
+}